@@ -0,0 +1,50 @@
+# ban_registry.py
+# 🚫 BAN REGISTRY
+# Who is banned and until when, in RAM. Loaded once at startup and kept in sync
+# by /ban and the unban button, so relay / search / matchmaking can reject a
+# banned user with a dict lookup instead of a banned_until query.
+# A min-heap ordered by expiry lifts bans as they run out.
+import datetime
+import heapq
+
+
+class BanRegistry:
+    def __init__(self):
+        self.until = {}   # {user_id: datetime}  (only active bans)
+        self.heap = []    # [(until, user_id)] ; stale entries are skipped on pop
+
+    def __len__(self):
+        return len(self.until)
+
+    def ban(self, user_id, until):
+        self.until[user_id] = until
+        heapq.heappush(self.heap, (until, user_id))
+
+    def unban(self, user_id):
+        self.until.pop(user_id, None) # Its heap entry goes stale and is dropped on expire()
+
+    def is_banned(self, user_id, now=None):
+        until = self.until.get(user_id)
+        if until is None: return False
+        if until > (now or datetime.datetime.now()): return True
+        del self.until[user_id] # Ran out before expire() got to it
+        return False
+
+    def banned_until(self, user_id):
+        return self.until.get(user_id) if self.is_banned(user_id) else None
+
+    def expire(self, now=None):
+        """Lifts every ban whose time is up. Returns the user_ids that were lifted."""
+        now = now or datetime.datetime.now()
+        lifted = []
+        while self.heap and self.heap[0][0] <= now:
+            until, user_id = heapq.heappop(self.heap)
+            if self.until.get(user_id) == until: # Not re-banned / unbanned since
+                del self.until[user_id]
+                lifted.append(user_id)
+        return lifted
+
+    def load(self, rows):
+        """Startup: [(user_id, banned_until), ...] for bans still running."""
+        for user_id, until in rows:
+            if until: self.ban(user_id, until)
@@ -0,0 +1,71 @@
+# batch_writer.py
+# ✍️ WRITE-BEHIND BUFFER
+# Hot paths (relay) drop rows here and move on. A background task writes them
+# in bulk when 'max_batch' rows pile up or every 'max_delay' seconds, whichever
+# comes first. The DB commit is no longer part of anybody's message latency.
+import asyncio
+import time
+
+
+class BatchWriter:
+    def __init__(self, name, flush_fn, max_batch=200, max_delay=1.0, max_pending=5000):
+        self.name = name
+        self.flush_fn = flush_fn        # async fn(rows) -> writes them all in one go
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending  # Backpressure: past this, put() waits for a flush
+        self.rows = []
+        self.lock = None                # asyncio objects are created inside the running loop
+        self.wake = None
+        self.stats = {"written": 0, "flushes": 0, "failed": 0, "dropped": 0, "last_ms": 0.0}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _ensure_loop_objects(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+            self.wake = asyncio.Event()
+
+    async def put(self, row):
+        self._ensure_loop_objects()
+        self.rows.append(row)
+        if len(self.rows) >= self.max_pending: await self.flush() # Writer fell behind -> caller helps out
+        elif len(self.rows) >= self.max_batch: self.wake.set()
+
+    def put_nowait(self, row):
+        """For sync callers: no backpressure, the writer is woken early instead."""
+        self.rows.append(row)
+        if self.wake and len(self.rows) >= self.max_batch: self.wake.set()
+
+    async def flush(self):
+        """Writes everything buffered so far. Safe to call from anywhere (reports, shutdown)."""
+        self._ensure_loop_objects()
+        async with self.lock: # One flush at a time keeps rows in order
+            while self.rows:
+                batch, self.rows = self.rows[:self.max_pending], self.rows[self.max_pending:]
+                t0 = time.perf_counter()
+                try:
+                    await self.flush_fn(batch)
+                except Exception as e:
+                    # Put them back in front; if the DB stays down, drop the oldest rather than grow forever
+                    self.stats["failed"] += 1
+                    self.rows = batch + self.rows
+                    overflow = len(self.rows) - self.max_pending * 2
+                    if overflow > 0:
+                        del self.rows[:overflow]
+                        self.stats["dropped"] += overflow
+                    print(f"❌ {self.name} flush failed ({len(batch)} rows): {e}")
+                    return
+                self.stats["written"] += len(batch)
+                self.stats["flushes"] += 1
+                self.stats["last_ms"] = (time.perf_counter() - t0) * 1000
+
+    async def run(self):
+        """Background loop: flush on size (wake) or time (max_delay)."""
+        self._ensure_loop_objects()
+        while True:
+            try: await asyncio.wait_for(self.wake.wait(), self.max_delay)
+            except asyncio.TimeoutError: pass
+            self.wake.clear()
+            if self.rows: await self.flush()
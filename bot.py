@@ -1,16 +1,22 @@
 import logging
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 import locales as locale_data
 from locales import get_text
 import datetime
 import asyncio
 import os
 import threading
+import secrets
+import hmac
+import signal
+from collections import deque
 import random  # <--- NEW
+from concurrent.futures import ThreadPoolExecutor
 import time  # <--- THIS WAS MISSING
 from game_data import GAME_DATA
-from flask import Flask
+from flask import Flask, request
 from telegram import (
     InlineKeyboardButton, InlineKeyboardMarkup, 
     ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, 
@@ -18,10 +24,21 @@ from telegram import (
 )
 from telegram.ext import (
     ApplicationBuilder, ContextTypes, CommandHandler, 
-    CallbackQueryHandler, MessageHandler, filters
+    CallbackQueryHandler, MessageHandler, TypeHandler, filters
 )
 from telegram.request import HTTPXRequest
-from ghost_engine import GhostEngine
+from ghost_engine import GhostEngine, AI_SESSIONS, LLM_STREAM
+from triggers import DOORMAN
+from batch_writer import BatchWriter
+from chat_state import ReplyMap, UserStatus
+from profile_cache import ProfileCache, PROFILE_COLUMNS
+from ban_registry import BanRegistry
+from update_processor import PerUserUpdateProcessor
+from outbound import OutboundScheduler, PRIORITY_RELAY, PRIORITY_BROADCAST, PRIORITY_NOTIFY
+from match_pool import MatchPool, normalize_tags
+from dislike_cache import DislikeCache
+from search_timers import SearchTimers
+from latency import percentile_ms
 
 # ==============================================================================
 # 🔐 SECURITY & CONFIGURATION
@@ -30,6 +47,22 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
 admin_env = os.getenv("ADMIN_IDS", "")
 ADMIN_IDS = [int(x) for x in admin_env.split(",") if x.strip().isdigit()]
+# MATCH_MODE: 'instant' = each search grabs its best partner right away (default)
+#             'batch'   = a job-queue tick pairs the whole waiting pool at once
+MATCH_MODE = os.getenv("MATCH_MODE", "instant")
+MATCH_TICK = float(os.getenv("MATCH_TICK", 2))          # seconds between batch rounds
+MATCH_MAX_WAIT = float(os.getenv("MATCH_MAX_WAIT", 10)) # after this, take any partner
+
+# UPDATE_MODE: 'polling' (default, getUpdates) or 'webhook' (Telegram POSTs to our PORT)
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")   # Public base URL, e.g. https://ometv-bot.onrender.com
+if UPDATE_MODE == "webhook" and not WEBHOOK_URL:
+    # Without a public URL Telegram has nowhere to POST -> poll, and say so (banner + /admin show the real mode)
+    print("⚠️ UPDATE_MODE=webhook but WEBHOOK_URL is empty -> falling back to polling")
+    UPDATE_MODE = "polling"
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+SHUTDOWN_DEADLINE = float(os.getenv("SHUTDOWN_DEADLINE", 10)) # seconds to drain sends + DB writes on stop
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
@@ -38,21 +71,47 @@ logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s
 # ==============================================================================
 # 1. RAM CACHE: Stores who is chatting with whom. Instant access. 0ms Latency.
 ACTIVE_CHATS = {} 
-# [NEW] Translation Map for Replies
-MESSAGE_MAP = {}
+# [NEW] Translation Map for Replies (per chat, both directions, capped per chat)
+MESSAGE_MAP = ReplyMap(cap_per_chat=int(os.getenv("REPLY_MAP_CAP", 500)))
 # --- GAME STATE & DATA ---
 GAME_STATES = {}       # {user_id: {'game': 'tod', 'turn': uid, 'partner': pid}}
 GAME_COOLDOWNS = {}    # {user_id: timestamp}
+# 3. MATCH POOL: Who is waiting right now, indexed by lang / age / interest.
+POOL = MatchPool()
+MATCH_STATS = {"ticks": 0, "pool": 0, "pairs": 0, "last_ms": 0.0, "max_ms": 0.0} # Batch mode tuning
+# 4. DISLIKES: {rater: {target, ...}} so matchmaking never queries user_interactions
+DISLIKES = DislikeCache(idle_ttl=int(os.getenv("DISLIKE_TTL", 1800)))
+# 5. SEARCH TIMERS: one deadline heap for every pending AI fallback
+SEARCH_TIMERS = SearchTimers()
+GHOST_DELAY = 15 # seconds of searching before the AI steps in
+RESTORED_SEARCHERS = [] # [(user_id, gender, region)] from restore_state, timers armed in post_init
+# 6. OUTBOX: rate-limited, prioritized sends (global + per-chat token buckets)
+OUTBOX = OutboundScheduler(global_rate=int(os.getenv("TG_GLOBAL_RATE", 30)), chat_rate=1.0, chat_burst=5)
+# 7. UPDATES: different users in parallel, each user's updates in order
+UPDATE_PROCESSOR = PerUserUpdateProcessor(max_concurrent_updates=int(os.getenv("UPDATE_CONCURRENCY", 64)))
+# 8. USER STATUS: idle/searching/chatting/waiting_notify lives here; users.status is a write-behind copy
+USER_STATUS = UserStatus(on_change=lambda uid, status, partner: STATUS_LOG.put_nowait((uid, status, partner)))
+# 9. PROFILES: read-through cache of the users row (TTL + LRU bound), kept fresh by update_user
+PROFILES = ProfileCache(ttl=int(os.getenv("PROFILE_TTL", 600)), max_size=int(os.getenv("PROFILE_CACHE_MAX", 10000)))
+# 10. BANS: active bans with an expiry heap -> O(1) "is banned?" anywhere
+BANS = BanRegistry()
+# 11. BACKGROUND TASKS: tracked so shutdown can cancel / finish them early
+GHOST_TASKS = set()    # pending execute_ghost_search tasks
+PENDING_MEDIA = {}     # {destroy_media_later task: (chat_id, message_id)}
 
 # 2. DB POOL: Keeps connections open so we don't "dial" the DB every time.
 DB_POOL = None
 GHOST = None # Will init later
+# DB THREADS: psycopg2 is blocking, so queries run here and never on the event loop.
+# One thread per pooled connection -> the pool can never run dry.
+DB_MAX_CONN = int(os.getenv("DB_MAX_CONN", 20))
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_MAX_CONN, thread_name_prefix="db")
 
 def init_db_pool():
     global DB_POOL
     if not DATABASE_URL: return
     try:
-        DB_POOL = psycopg2.pool.SimpleConnectionPool(1, 20, dsn=DATABASE_URL)
+        DB_POOL = psycopg2.pool.ThreadedConnectionPool(1, DB_MAX_CONN, dsn=DATABASE_URL)
         print("✅ CONNECTION POOL STARTED.")
     except Exception as e:
         print(f"❌ Pool Error: {e}")
@@ -66,6 +125,70 @@ def release_conn(conn):
     # Puts the line back in the pool
     if DB_POOL and conn: DB_POOL.putconn(conn)
 
+def _db_job(fn):
+    # Runs on a DB thread: get line -> fn(cur) -> commit -> release line
+    conn = get_conn()
+    if not conn: return None
+    cur = conn.cursor()
+    try:
+        result = fn(cur)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_conn(conn)
+
+async def run_db(fn):
+    """Awaits fn(cur) on the DB thread pool. The loop keeps serving other users meanwhile."""
+    return await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, _db_job, fn)
+
+async def db_execute(sql, params=()):
+    await run_db(lambda cur: cur.execute(sql, params))
+
+async def db_fetchone(sql, params=()):
+    def job(cur):
+        cur.execute(sql, params)
+        return cur.fetchone()
+    return await run_db(job)
+
+async def db_fetchall(sql, params=()):
+    def job(cur):
+        cur.execute(sql, params)
+        return cur.fetchall()
+    return await run_db(job) or []
+
+async def write_chat_logs(rows):
+    # One multi-row INSERT per batch instead of INSERT+COMMIT per message
+    await run_db(lambda cur: execute_values(cur, "INSERT INTO chat_logs (sender_id, receiver_id, message, timestamp) VALUES %s", rows))
+
+# Human chat messages are logged write-behind: relay never waits for a commit
+CHAT_LOG = BatchWriter("chat_logs", write_chat_logs, max_batch=200, max_delay=2.0, max_pending=5000)
+
+async def write_statuses(rows):
+    # Last move per user wins; partner_id None = leave the column alone
+    latest = {}
+    for uid, status, partner in rows:
+        prev = latest.get(uid)
+        latest[uid] = (uid, status, partner if partner is not None else (prev[2] if prev else None))
+    await run_db(lambda cur: execute_values(cur,
+        """UPDATE users SET status = v.status, partner_id = COALESCE(v.partner_id, users.partner_id)
+           FROM (VALUES %s) AS v(user_id, status, partner_id) WHERE users.user_id = v.user_id""",
+        list(latest.values()), template="(%s::bigint, %s, %s::bigint)"))
+
+STATUS_LOG = BatchWriter("status", write_statuses, max_batch=200, max_delay=0.5, max_pending=5000)
+
+async def write_ai_chats(rows):
+    # users.ai_persona = who they are talking to (None = not with the AI). Last one per user wins.
+    latest = list(dict(rows).items())
+    await run_db(lambda cur: execute_values(cur,
+        "UPDATE users SET ai_persona = v.persona FROM (VALUES %s) AS v(user_id, persona) WHERE users.user_id = v.user_id",
+        latest, template="(%s::bigint, %s)"))
+
+AI_CHAT_LOG = BatchWriter("ai_chats", write_ai_chats, max_batch=200, max_delay=0.5, max_pending=5000)
+
 # ==============================================================================
 # ❤️ THE HEARTBEAT
 # ==============================================================================
@@ -75,6 +198,32 @@ app_flask = Flask(__name__)
 def health_check():
     return "Bot is Alive!", 200
 
+# Webhook mode: the same Flask server feeds updates straight into the bot's queue
+BOT_APP = None
+BOT_LOOP = None
+
+@app_flask.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    # Constant-time compare: no timing hints about how much of the secret matched
+    if not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(), WEBHOOK_SECRET.encode()): return "Forbidden", 403
+    if not BOT_APP or not BOT_LOOP: return "Starting", 503 # Telegram retries
+    try: update = Update.de_json(request.get_json(force=True), BOT_APP.bot)
+    except Exception: return "Bad Request", 400
+    asyncio.run_coroutine_threadsafe(BOT_APP.update_queue.put(update), BOT_LOOP)
+    return "OK", 200
+
+# Ingestion latency (Telegram's message date -> our first handler), per mode
+INGEST_LATENCY = deque(maxlen=1000)
+
+async def track_ingest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    msg = update.effective_message
+    if msg and msg.date and not (update.callback_query or msg.edit_date):
+        INGEST_LATENCY.append(time.time() - msg.date.timestamp())
+
+def ingest_stats():
+    if not INGEST_LATENCY: return 0.0, 0.0
+    return sum(INGEST_LATENCY) / len(INGEST_LATENCY) * 1000, percentile_ms(INGEST_LATENCY, 95)
+
 def run_flask():
     port = int(os.environ.get("PORT", 8080))
     app_flask.run(host="0.0.0.0", port=port)
@@ -123,16 +272,68 @@ def init_db():
     try:
         cols = ["username TEXT", "first_name TEXT", "report_count INTEGER DEFAULT 0", 
                 "banned_until TIMESTAMP", "gender TEXT DEFAULT 'Hidden'", 
-                "age_range TEXT DEFAULT 'Hidden'", "region TEXT DEFAULT 'Hidden'"]
+                "age_range TEXT DEFAULT 'Hidden'", "region TEXT DEFAULT 'Hidden'",
+                "interest_tags TEXT[]", "ai_persona TEXT"]
         for c in cols: cur.execute(f"ALTER TABLE users ADD COLUMN IF NOT EXISTS {c};")
     except: pass
 
+    # Interests: normalized once at write time into a tag array (GIN -> "shares any of these tags" via &&).
+    # Backfill is one-time: after it, update_user always writes both columns.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_interest_tags ON users USING GIN (interest_tags)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_interactions_dislikes ON user_interactions (rater_id) WHERE score = -1")
+    # Restart restore only ever looks at online users -> keep that scan tiny
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_online ON users (status) WHERE status <> 'idle'")
+    cur.execute("""UPDATE users SET interest_tags = ARRAY(
+                       SELECT DISTINCT lower(trim(t)) FROM unnest(string_to_array(interests, ',')) AS t
+                       WHERE trim(t) <> '' ORDER BY 1)
+                   WHERE interest_tags IS NULL AND interests <> ''""")
+
     conn.commit()
+
+    t0 = time.perf_counter()
+    restore_state(cur)
+    conn.commit()
+
     cur.close()
     release_conn(conn)
-    print("✅ DATABASE SCHEMA READY.")
+    print(f"✅ DATABASE SCHEMA READY. ({len(POOL)} in match pool, {len(ACTIVE_CHATS)} in chats, "
+          f"{len(BANS)} active bans, restored in {(time.perf_counter() - t0) * 1000:.0f}ms)")
     global GHOST
-    GHOST = GhostEngine(DB_POOL)
+    GHOST = GhostEngine(DB_POOL, DB_EXECUTOR)
+
+
+def restore_state(cur):
+    """
+    Rebuilds RAM from the durable columns after a deploy / crash.
+    users.status + partner_id (human chats) and ai_persona (AI chats) are kept
+    current by the write-behind writers, so they are the journal: a handful of
+    set-based queries over online users instead of replaying anything.
+    GAME_STATES and reply threading (MESSAGE_MAP) are not restored.
+    """
+    # 1. Orphans in one pass: 'chatting' only counts if the partner points back at us
+    cur.execute("""UPDATE users a SET status = 'idle', partner_id = 0
+                   WHERE a.status = 'chatting' AND NOT EXISTS (
+                       SELECT 1 FROM users b WHERE b.user_id = a.partner_id
+                       AND b.partner_id = a.user_id AND b.status = 'chatting')""")
+    cur.execute("UPDATE users SET ai_persona = NULL WHERE ai_persona IS NOT NULL AND status <> 'searching'")
+
+    # 2. Human pairs (both halves come back, each row points at the other)
+    cur.execute("SELECT user_id, partner_id FROM users WHERE status = 'chatting'")
+    for uid, pid in cur.fetchall(): ACTIVE_CHATS[uid] = pid
+
+    # 3. Match pool: whoever was still searching (AI chatters included, as before)
+    cur.execute("SELECT user_id, language, interest_tags, age_range, mood, ai_persona, gender, region FROM users WHERE status = 'searching' AND (banned_until IS NULL OR banned_until < NOW())")
+    for r in cur.fetchall():
+        POOL.add(r[0], r[1], r[2], r[3], r[4])
+        # AI chats: the session itself is rebuilt on the user's next message
+        if r[5]: ACTIVE_CHATS[r[0]] = f"AI_{r[5]}"
+        # Everyone else still needs their AI fallback (the timer heap died with the old process)
+        else: RESTORED_SEARCHERS.append((r[0], r[6] or "Hidden", r[7] or "Unknown"))
+
+    cur.execute("SELECT user_id, status FROM users WHERE status <> 'idle'")
+    USER_STATUS.load(cur.fetchall())
+    cur.execute("SELECT user_id, banned_until FROM users WHERE banned_until > NOW()")
+    BANS.load(cur.fetchall())
 
 
 # ==============================================================================
@@ -161,59 +362,105 @@ def get_keyboard_chat():
 def get_keyboard_game():
     return ReplyKeyboardMarkup([[KeyboardButton("🛑 Stop Game"), KeyboardButton("🛑 Stop Chat")]], resize_keyboard=True)
 
+# Button label -> action, built ONCE from every language in locales.TEXTS plus the
+# fixed chat/game keyboards. handle_text_input does one dict lookup per message,
+# and a new language adds entries here, not per-message work.
+LOCALE_ACTIONS = {"START_BTN": "start", "STOP_SEARCH": "stop_search", "CHANGE_INTERESTS": "interests",
+                  "SETTINGS": "settings", "MY_ID": "my_id", "HELP": "help"}
+BUTTON_ACTIONS = {}
+for _key, _action in LOCALE_ACTIONS.items():
+    for _texts in locale_data.TEXTS.values():
+        if _key in _texts: BUTTON_ACTIONS.setdefault(_texts[_key], _action)
+for _label, _action in {"🛑 Stop": "stop", "🛑 Stop Chat": "stop", "⏭️ Next": "next",
+                        "🎮 Games": "games", "🛑 Stop Game": "stop_game"}.items():
+    BUTTON_ACTIONS.setdefault(_label, _action)
+
 
 # ==============================================================================
 # 🧠 MATCHMAKING ENGINE (Fixed Design + Performance)
 # ==============================================================================
-def find_match(user_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # Fetch Me (Including Mood)
-    cur.execute("SELECT language, interests, age_range, mood FROM users WHERE user_id = %s", (user_id,))
-    me = cur.fetchone()
-    if not me: release_conn(conn); return None, [], "Neutral", "English"
-    my_lang, my_interests, my_age, my_mood = me
-    my_tags = [t.strip().lower() for t in my_interests.split(',')] if my_interests else []
-
-    # Fetch Dislikes
-    cur.execute("SELECT target_id FROM user_interactions WHERE rater_id = %s AND score = -1", (user_id,))
-    disliked_ids = {row[0] for row in cur.fetchall()}
-
-    # Fetch Candidates (Including Mood)
-    cur.execute("""
-        SELECT user_id, language, interests, age_range, mood 
-        FROM users 
-        WHERE status = 'searching' AND user_id != %s
-        AND (banned_until IS NULL OR banned_until < NOW())
-    """, (user_id,))
-    candidates = cur.fetchall()
-    
-    best_match, best_score, common_interests = None, -999999, []
-    p_mood, p_lang = "Neutral", "English"
-
-    for cand in candidates:
-        cand_id, cand_lang, cand_interests, cand_age, cand_mood = cand
-        cand_tags = [t.strip().lower() for t in cand_interests.split(',')] if cand_interests else []
-        
-        score = 0
-        if cand_id in disliked_ids: score -= 1000
-        
-        matched_tags = list(set(my_tags) & set(cand_tags))
-        if matched_tags: score += 40
-        if cand_lang == my_lang: score += 20
-        if cand_age == my_age and cand_age != 'Hidden': score += 10
-            
-        if score > best_score:
-            best_score = score
-            best_match = cand_id
-            common_interests = matched_tags
-            p_mood = cand_mood
-            p_lang = cand_lang
-
-    cur.close()
-    release_conn(conn)
-    return best_match, common_interests, p_mood, p_lang
+PROFILE_SQL = f"SELECT {', '.join(PROFILE_COLUMNS)} FROM users WHERE user_id = %s"
+
+async def get_profile(user_id):
+    """Read-through: cached profile dict, otherwise one query. None if the user doesn't exist."""
+    profile = PROFILES.get(user_id)
+    if profile is None:
+        row = await db_fetchone(PROFILE_SQL, (user_id,))
+        if row: profile = PROFILES.put(user_id, row)
+    return profile
+
+async def get_dislikes(user_id):
+    """Read-through: RAM if loaded, otherwise one indexed query."""
+    found = DISLIKES.get(user_id)
+    if found is None:
+        rows = await db_fetchall("SELECT target_id FROM user_interactions WHERE rater_id = %s AND score = -1", (user_id,))
+        found = DISLIKES.put(user_id, [r[0] for r in rows])
+    return found
+
+async def evict_idle_caches(context: ContextTypes.DEFAULT_TYPE):
+    DISLIKES.evict_idle()
+    AI_SESSIONS.evict_idle() # Abandoned AI chats (the session is rebuilt if they ever write again)
+
+async def expire_bans(context: ContextTypes.DEFAULT_TYPE):
+    lifted = BANS.expire()
+    if lifted: print(f"🔓 {len(lifted)} ban(s) expired")
+
+async def find_match(user_id):
+    if BANS.is_banned(user_id): return None, [], "Neutral", "English"
+    # Fetch Me (RAM first, DB if I'm not in the pool)
+    me = POOL.get(user_id)
+    if not me:
+        p = await get_profile(user_id)
+        if not p: return None, [], "Neutral", "English"
+        me = MatchPool.make_entry(p['language'], p['interest_tags'], p['age_range'], p['mood'])
+
+    # Fetch Dislikes (cached after the first search)
+    disliked_ids = await get_dislikes(user_id)
+
+    # Pick + claim with no await in between -> two searchers can never grab the
+    # same partner. If someone already claimed ME while the dislikes loaded, stop.
+    # A refused claim means the pick just left the pool -> the next pick is the next best.
+    for _ in range(3):
+        if user_id not in POOL: break
+        best_match, common_interests = POOL.best_match(user_id, me, disliked_ids)
+        if not best_match: break
+        partner = POOL.claim(user_id, best_match)
+        if partner: return best_match, common_interests, partner['mood'], partner['lang']
+    return None, [], "Neutral", "English"
+
+async def batch_match_tick(context: ContextTypes.DEFAULT_TYPE):
+    """MATCH_MODE=batch: pairs the whole pool every MATCH_TICK seconds."""
+    if len(POOL) < 2: return
+    t0 = time.perf_counter()
+
+    # 1. Dislikes: cached ones from RAM, one query for everyone not loaded yet
+    missing = [u for u in POOL.users if u not in DISLIKES]
+    if missing:
+        rows = await db_fetchall("SELECT rater_id, target_id FROM user_interactions WHERE score = -1 AND rater_id = ANY(%s)", (missing,))
+        loaded = {u: [] for u in missing}
+        for rater, target in rows: loaded[rater].append(target)
+        for u, targets in loaded.items(): DISLIKES.put(u, targets)
+    dislikes = {u: DISLIKES.get(u) or set() for u in POOL.users} # (late joiners: no dislikes this round)
+
+    # 2. Pair + claim synchronously (the pool can't change under us from here)
+    pool_size = len(POOL)
+    matches = []
+    for a, b, common in POOL.pair_round(dislikes, MATCH_MAX_WAIT):
+        entry_a, entry_b = POOL.get(a), POOL.get(b)
+        if POOL.claim(a, b): matches.append((a, b, common, entry_a, entry_b))
+
+    ms = (time.perf_counter() - t0) * 1000
+    MATCH_STATS["ticks"] += 1
+    MATCH_STATS["pool"] = pool_size
+    MATCH_STATS["pairs"] = len(matches)
+    MATCH_STATS["last_ms"] = ms
+    MATCH_STATS["max_ms"] = max(MATCH_STATS["max_ms"], ms)
+    if ms > MATCH_TICK * 1000 / 2:
+        logging.warning(f"Match tick took {ms:.0f}ms for {pool_size} users (tick is {MATCH_TICK}s)")
+
+    # 3. Connect (connect_users also ends any AI chat they were in)
+    await asyncio.gather(*[connect_users(context, a, b, common, entry_b['mood'], entry_b['lang'])
+                           for a, b, common, entry_a, entry_b in matches])
 
 # ==============================================================================
 # 👮 ADMIN SYSTEM
@@ -333,8 +580,8 @@ async def send_wyr_round(context, p1, p2):
         [InlineKeyboardButton("🅱️ Choose Option B", callback_data="wyr_b")]
     ]
     
-    await context.bot.send_message(p1, msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
-    await context.bot.send_message(p2, msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
+    for p in (p1, p2):
+        await OUTBOX.send(p, lambda p=p: context.bot.send_message(p, msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown'), PRIORITY_RELAY)
 
 async def send_rps_round(context, p1, p2):
     kb = [[InlineKeyboardButton("🪨", callback_data="rps_rock"), InlineKeyboardButton("📄", callback_data="rps_paper"), InlineKeyboardButton("✂️", callback_data="rps_scissors")]]
@@ -343,31 +590,56 @@ async def send_rps_round(context, p1, p2):
 
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS: return
-    conn = get_conn(); cur = conn.cursor()
-    
-    cur.execute("SELECT COUNT(*) FROM users")
-    total = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM users WHERE status != 'idle'")
-    online = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM users WHERE report_count > 0")
-    flagged = cur.fetchone()[0]
-    
-    cur.execute("SELECT gender, COUNT(*) FROM users GROUP BY gender")
-    g_stats = " | ".join([f"{r[0]}:{r[1]}" for r in cur.fetchall()])
 
-    def get_stat(col):
-        cur.execute(f"SELECT {col}, COUNT(*) FROM users GROUP BY {col} ORDER BY COUNT(*) DESC LIMIT 3")
-        return " | ".join([f"{r[0]}:{r[1]}" for r in cur.fetchall()])
+    def load_stats(cur):
+        cur.execute("SELECT COUNT(*) FROM users")
+        total = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM users WHERE report_count > 0")
+        flagged = cur.fetchone()[0]
+        
+        cur.execute("SELECT gender, COUNT(*) FROM users GROUP BY gender")
+        g_stats = " | ".join([f"{r[0]}:{r[1]}" for r in cur.fetchall()])
+
+        cur.execute("SELECT region, COUNT(*) FROM users GROUP BY region ORDER BY COUNT(*) DESC LIMIT 3")
+        r_stats = " | ".join([f"{r[0]}:{r[1]}" for r in cur.fetchall()])
+        return total, flagged, g_stats, r_stats
+
+    total, flagged, g_stats, r_stats = await run_db(load_stats)
+    s_counts = USER_STATUS.counts()
+    online = sum(s_counts.values())
+    d_stats = DISLIKES.stats()
+    r_map = MESSAGE_MAP.stats()
+    q_depth = OUTBOX.depth()
+    u_stats = UPDATE_PROCESSOR.stats()
+    in_avg, in_p95 = ingest_stats()
 
     msg = (f"👮 **CONTROL ROOM**\n"
            f"👥 Total: `{total}` | 🟢 Online: `{online}`\n"
            f"⚠️ Flagged: `{flagged}`\n"
            f"🚻 **Gender:** {g_stats}\n"
-           f"🌍 {get_stat('region')}\n\n"
+           f"🌍 {r_stats}\n"
+           f"🧮 Match: `{MATCH_MODE}` | Pool: `{len(POOL)}`"
+           + (f" | Tick: `{MATCH_STATS['last_ms']:.1f}ms` (max `{MATCH_STATS['max_ms']:.1f}`) | Last pairs: `{MATCH_STATS['pairs']}`" if MATCH_MODE == "batch" else "")
+           + "\n"
+           f"👎 Dislike cache: `{d_stats['users']}` users, `{d_stats['bytes'] // 1024}`KB (`{d_stats['bytes_per_user']}`B/user)\n"
+           f"↩️ Reply map: `{r_map['chats']}` chats, `{r_map['bytes'] // 1024}`KB (`{r_map['bytes_per_chat']}`B/chat)\n"
+           f"📮 Outbox: relay `{q_depth[PRIORITY_RELAY]}` | bcast `{q_depth[PRIORITY_BROADCAST]}` | notify `{q_depth[PRIORITY_NOTIFY]}` | "
+           f"p50 `{OUTBOX.latency_ms(50):.0f}ms` p95 `{OUTBOX.latency_ms(95):.0f}ms` | 429s `{OUTBOX.stats['retry_after']}`\n"
+           f"🪪 Profiles: `{len(PROFILES)}` cached | hit rate `{PROFILES.hit_rate():.0%}` ({PROFILES.stats['hits']}/{PROFILES.stats['misses']})\n"
+           f"🔀 Status: searching `{s_counts['searching']}` | chatting `{s_counts['chatting']}` | notify `{s_counts['waiting_notify']}` | illegal moves `{USER_STATUS.illegal}`\n"
+           + (f"🧠 LLM: running `{GHOST.llm.running}`/{GHOST.llm.max_in_flight} | waiting `{GHOST.llm.waiting}` | "
+              f"queue p50 `{GHOST.llm.queue_ms(50):.0f}ms` p95 `{GHOST.llm.queue_ms(95):.0f}ms` | "
+              f"llm p50 `{GHOST.llm.latency_ms(50):.0f}ms` p95 `{GHOST.llm.latency_ms(95):.0f}ms` | "
+              f"shed `{GHOST.llm.stats['shed']}` timeouts `{GHOST.llm.stats['timeouts']}` | "
+              f"local replies `{GHOST.quick.hit_rate():.0%}` ({GHOST.quick.stats['hits']})\n" if GHOST else "")
+           + f"👻 AI sessions: `{len(AI_SESSIONS)}` (`{AI_SESSIONS.nbytes() // 1024}`KB text) | ended `{AI_SESSIONS.stats['ended']}` evicted `{AI_SESSIONS.stats['evicted']}`\n"
+           f"🚦 Updates: running `{u_stats['running']}`/{UPDATE_PROCESSOR.cap} | users `{u_stats['users']}` | busiest queue `{u_stats['busiest_len']}`\n"
+           f"📥 Ingest ({UPDATE_MODE}): avg `{in_avg:.0f}ms` p95 `{in_p95:.0f}ms` (1s resolution)\n\n"
            f"🛠️ **COMMANDS:**\n"
            f"• `/ban ID HOURS` (e.g., /ban 12345 24)\n"
            f"• `/warn ID REASON` (e.g., /warn 12345 No spam)\n"
            f"• `/broadcast MESSAGE` (Send to all)\n"
+           f"• `/reload_personas` (After editing ai_personas, `{len(GHOST.persona_keys) if GHOST else 0}` loaded)\n"
            f"• `/unban ID` (Via button only)")
     
     kb = [[InlineKeyboardButton("📢 Broadcast", callback_data="admin_broadcast_info"), InlineKeyboardButton("📜 Recent Users", callback_data="admin_users")],
@@ -378,21 +650,38 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.callback_query: await update.callback_query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
         else: await update.message.reply_text(msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
     except error.BadRequest: pass
-    cur.close(); release_conn(conn)
+
+async def admin_reload_personas(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS: return
+    try:
+        n = await GHOST.reload_personas()
+        await update.message.reply_text(f"🎭 Reloaded {n} personas.")
+    except Exception as e: await update.message.reply_text(f"❌ Reload failed: {e}")
 
 async def admin_ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS: return
     try:
         target = int(context.args[0])
         hours = int(context.args[1])
-        conn = get_conn(); cur = conn.cursor()
         ban_until = datetime.datetime.now() + datetime.timedelta(hours=hours)
-        cur.execute("UPDATE users SET banned_until = %s WHERE user_id = %s", (ban_until, target))
-        conn.commit(); cur.close(); release_conn(conn)
+        await db_execute("UPDATE users SET banned_until = %s WHERE user_id = %s", (ban_until, target))
+        PROFILES.update(target, banned_until=ban_until)
+        BANS.ban(target, ban_until) # Relay / search / matching reject them from now on
         await update.message.reply_text(f"🔨 Banned {target} for {hours}h.")
         
-        # Clear RAM cache if online
-        if target in ACTIVE_CHATS: del ACTIVE_CHATS[target]
+        # Clear RAM cache if online (and free their partner)
+        partner_id = ACTIVE_CHATS.pop(target, None)
+        POOL.remove(target)
+        SEARCH_TIMERS.cancel(target)
+        MESSAGE_MAP.close(target)
+        if isinstance(partner_id, int):
+            ACTIVE_CHATS.pop(partner_id, None)
+            USER_STATUS.set(target, 'idle', 0); USER_STATUS.set(partner_id, 'idle', 0)
+            try: await context.bot.send_message(partner_id, "😶‍🌫️ **Partner Disconnected.**", reply_markup=get_keyboard_lobby(), parse_mode='Markdown')
+            except: pass
+        else:
+            USER_STATUS.set(target, 'idle')
+            if partner_id: end_ai_chat(target)
         
         try: await context.bot.send_message(target, f"🚫 You are banned for {hours} hours.")
         except: pass
@@ -411,22 +700,20 @@ async def admin_broadcast_execute(update: Update, context: ContextTypes.DEFAULT_
     if update.effective_user.id not in ADMIN_IDS: return
     msg = " ".join(context.args)
     if not msg: return await update.message.reply_text("Usage: /broadcast MSG")
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT user_id FROM users")
-    users = cur.fetchall(); cur.close(); release_conn(conn)
+    users = await db_fetchall("SELECT user_id FROM users")
     await update.message.reply_text(f"📢 Sending to {len(users)} users...")
-    for u in users:
-        try: await context.bot.send_message(u[0], f"📢 **ANNOUNCEMENT:**\n\n{msg}", parse_mode='Markdown')
-        except: pass
-    await update.message.reply_text("✅ Broadcast done.")
+    # Queue everything at broadcast priority; the OUTBOX paces it and never starves live chats
+    results = await asyncio.gather(*[
+        OUTBOX.submit(u[0], lambda uid=u[0]: context.bot.send_message(uid, f"📢 **ANNOUNCEMENT:**\n\n{msg}", parse_mode='Markdown'), PRIORITY_BROADCAST)
+        for u in users], return_exceptions=True)
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    await update.message.reply_text(f"✅ Broadcast done. ({len(users) - failed} delivered, {failed} failed)")
 
 async def handle_feedback_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     feedback_text = update.message.text.replace("/feedback", "").strip()
     if not feedback_text: await update.message.reply_text("❌ Usage: `/feedback message`", parse_mode='Markdown'); return
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("INSERT INTO feedback (user_id, message) VALUES (%s, %s)", (user_id, feedback_text))
-    conn.commit(); cur.close(); release_conn(conn)
+    await db_execute("INSERT INTO feedback (user_id, message) VALUES (%s, %s)", (user_id, feedback_text))
     await update.message.reply_text("✅ **Feedback Sent!**", parse_mode='Markdown')
 
 # ==============================================================================
@@ -482,19 +769,16 @@ async def send_onboarding_step(update, step):
 # ==============================================================================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT banned_until, gender FROM users WHERE user_id = %s", (user.id,))
-    data = cur.fetchone()
-    if data and data[0] and data[0] > datetime.datetime.now():
-        await update.message.reply_text(f"🚫 Banned until {data[0]}."); cur.close(); release_conn(conn); return
+    if BANS.is_banned(user.id):
+        await update.message.reply_text(f"🚫 Banned until {BANS.banned_until(user.id)}."); return
+    data = await get_profile(user.id)
     
-    cur.execute("""INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s) 
+    await db_execute("""INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s) 
                    ON CONFLICT (user_id) DO UPDATE SET username = %s, first_name = %s""", 
                    (user.id, user.username, user.first_name, user.username, user.first_name))
-    conn.commit(); cur.close(); release_conn(conn)
 
     welcome_msg = "👋 **Welcome to OmeTV Chatbot🤖**\n\nConnect with strangers worldwide 🌍\nNo names. No login.End to End encrypted\n\n*Let's vibe check.* 👇"
-    if not data or data[1] == 'Hidden':
+    if not data or data['gender'] == 'Hidden':
         await update.message.reply_text(welcome_msg, reply_markup=ReplyKeyboardRemove(), parse_mode='Markdown')
         await send_onboarding_step(update, 1)
     else:
@@ -551,25 +835,22 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["state"] = None
         await update.message.reply_text("✅ **Ready!**", reply_markup=get_keyboard_lobby(), parse_mode='Markdown'); return
 
-    # 4. BUTTON TEXT TRIGGERS (MULTI-LANGUAGE SUPPORT)
+    # 4. BUTTON TEXT TRIGGERS (MULTI-LANGUAGE SUPPORT) - one lookup, see BUTTON_ACTIONS
+    action = BUTTON_ACTIONS.get(text)
     
     # Check Start Button (English, Indo, Hindi...)
-    all_starts = [x["START_BTN"] for x in locale_data.TEXTS.values()]
-    if text in all_starts: await start_search(update, context); return
+    if action == "start": await start_search(update, context); return
 
     # Check Stop Searching Button
-    all_stops = [x["STOP_SEARCH"] for x in locale_data.TEXTS.values()]
-    if text in all_stops: await stop_search_process(update, context); return
+    if action == "stop_search": await stop_search_process(update, context); return
 
     # Check Change Interests
-    all_interests = [x["CHANGE_INTERESTS"] for x in locale_data.TEXTS.values()]
-    if text in all_interests: 
+    if action == "interests": 
         context.user_data["state"] = "ONBOARDING_INTEREST"
         await update.message.reply_text("👇 Type interests:", reply_markup=ReplyKeyboardRemove()); return
 
     # Check Settings
-    all_settings = [x["SETTINGS"] for x in locale_data.TEXTS.values()]
-    if text in all_settings:
+    if action == "settings":
         kb = [
             [InlineKeyboardButton("🚻 Gender", callback_data="set_gen_menu"), InlineKeyboardButton("🎂 Age", callback_data="set_age_menu")],
             [InlineKeyboardButton("🗣️ Lang", callback_data="set_lang_menu"), InlineKeyboardButton("🎭 Mood", callback_data="set_mood_menu")],
@@ -578,25 +859,23 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚙️ **Settings:**", reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown'); return
 
     # Check My ID
-    all_ids = [x["MY_ID"] for x in locale_data.TEXTS.values()]
-    if text in all_ids: await show_profile(update, context); return
+    if action == "my_id": await show_profile(update, context); return
 
     # Check Help
-    all_helps = [x["HELP"] for x in locale_data.TEXTS.values()]
-    if text in all_helps: await help_command(update, context); return
+    if action == "help": await help_command(update, context); return
 
     # GLOBAL COMMANDS (No translation needed for Stop/Next inside chat usually)
-    if text in ["🛑 Stop", "🛑 Stop Chat"]: await stop_chat(update, context); return
-    if text == "⏭️ Next": await stop_chat(update, context, is_next=True); return
+    if action == "stop": await stop_chat(update, context); return
+    if action == "next": await stop_chat(update, context, is_next=True); return
     
     # 5. GAME MENU
-    if text == "🎮 Games":
+    if action == "games":
         kb = [[InlineKeyboardButton("😈 Truth or Dare", callback_data="game_offer_Truth or Dare")],
               [InlineKeyboardButton("🎲 Would You Rather", callback_data="game_offer_Would You Rather")],
               [InlineKeyboardButton("✂️ Rock Paper Scissors", callback_data="rps_mode_select")]]
         await update.message.reply_text("🎮 **Game Center**", reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown'); return
     
-    if text == "🛑 Stop Game":
+    if action == "stop_game":
         pid = ACTIVE_CHATS.get(user_id)
         if user_id in GAME_STATES: del GAME_STATES[user_id]
         if pid and pid in GAME_STATES: del GAME_STATES[pid]
@@ -610,14 +889,8 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # User Commands
         if cmd == "/search":
-            # 1. Check DB for 'searching' status (ACTIVE_CHATS only tracks active chats, not waiters)
-            conn = get_conn(); cur = conn.cursor()
-            cur.execute("SELECT status FROM users WHERE user_id = %s", (user_id,))
-            status_row = cur.fetchone()
-            cur.close(); release_conn(conn)
-            
-            # 2. Logic: If in RAM (Chatting) OR DB says Searching -> Block it
-            if user_id in ACTIVE_CHATS or (status_row and status_row[0] == 'searching'):
+            # If in RAM (Chatting) OR already Searching -> Block it
+            if user_id in ACTIVE_CHATS or USER_STATUS.get(user_id) == 'searching':
                 await update.message.reply_text("⚠️ **User are already in chat** (or connecting).", parse_mode='Markdown')
             else:
                 await start_search(update, context)
@@ -647,40 +920,43 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ==============================================================================
 # 🔌 FAST CONNECTION LOGIC (RAM + DB)
 # ==============================================================================
-async def execute_ghost_search(context, user_id, u_gender, u_region):
-    """Waits 15s and connects AI if user is still searching."""
-    await asyncio.sleep(15)  # ⏳ THE 15 SECOND WAIT
+def on_search_timeout(bot, user_id, data):
+    """Fired by SEARCH_TIMERS after GHOST_DELAY. RAM check only: still waiting & not chatting?"""
+    if user_id in POOL and user_id not in ACTIVE_CHATS:
+        u_gender, u_region = data
+        task = asyncio.create_task(execute_ghost_search(bot, user_id, u_gender, u_region))
+        GHOST_TASKS.add(task); task.add_done_callback(GHOST_TASKS.discard)
+
+async def execute_ghost_search(bot, user_id, u_gender, u_region):
+    """Connects AI (the timer already checked the user is still searching)."""
+    # Pick Persona
+    persona = await GHOST.pick_random_persona() 
+    user_ctx = {'gender': u_gender, 'country': u_region}
     
-    # 1. Check DB: Is user still searching?
-    conn = get_conn()
-    if not conn: return
-    cur = conn.cursor()
-    cur.execute("SELECT status FROM users WHERE user_id = %s", (user_id,))
-    status = cur.fetchone()
-    cur.close()
-    release_conn(conn)
+    # Start AI Session
+    success = await GHOST.start_chat(user_id, persona, "Hidden", user_ctx)
     
-    # 2. Connect if still searching
-    if status and status[0] == 'searching':
-        # Pick Persona
-        persona = GHOST.pick_random_persona() 
-        user_ctx = {'gender': u_gender, 'country': u_region}
+    # A human may have grabbed them while the persona loaded
+    if success and not (user_id in POOL and user_id not in ACTIVE_CHATS):
+        GHOST.end_chat(user_id) # Too late -> drop the session we just built
+    elif success:
+        ACTIVE_CHATS[user_id] = f"AI_{persona}"
+        AI_CHAT_LOG.put_nowait((user_id, persona))
         
-        # Start AI Session
-        success = await GHOST.start_chat(user_id, persona, "Hidden", user_ctx)
+        msg = (f"⚡ **PARTNER FOUND!**\n\n"
+               f"🎭 **Mood:** Random\n"
+               f"🗣️ **Lang:** Mixed\n\n"
+               f"⚠️ *Say Hi!*")
         
-        if success:
-            ACTIVE_CHATS[user_id] = f"AI_{persona}"
-            
-            msg = (f"⚡ **PARTNER FOUND!**\n\n"
-                   f"🎭 **Mood:** Random\n"
-                   f"🗣️ **Lang:** Mixed\n\n"
-                   f"⚠️ *Say Hi!*")
-            
-            try:
-                await context.bot.send_message(user_id, msg, reply_markup=get_keyboard_chat(), parse_mode='Markdown')
-            except Exception as e:
-                print(f"❌ Ghost Error: {e}")
+        try:
+            await bot.send_message(user_id, msg, reply_markup=get_keyboard_chat(), parse_mode='Markdown')
+        except Exception as e:
+            print(f"❌ Ghost Error: {e}")
+
+def end_ai_chat(user_id):
+    """AI chat over: free the session now and clear the durable ai_persona."""
+    GHOST.end_chat(user_id)
+    AI_CHAT_LOG.put_nowait((user_id, None))
 
 async def connect_users(context, user_id, partner_id, common, p_mood, p_lang):
     """Connects two humans, interrupting AI if necessary."""
@@ -689,16 +965,17 @@ async def connect_users(context, user_id, partner_id, common, p_mood, p_lang):
         if isinstance(ACTIVE_CHATS.get(uid), str):
             # Clean AI memory if they were talking to bot
             if uid in GAME_STATES: del GAME_STATES[uid]
+            end_ai_chat(uid)
             
-    # 2. Update DB (Now officially chatting)
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("UPDATE users SET status='chatting', partner_id=%s WHERE user_id=%s", (partner_id, user_id))
-    cur.execute("UPDATE users SET status='chatting', partner_id=%s WHERE user_id=%s", (user_id, partner_id))
-    conn.commit(); cur.close(); release_conn(conn)
-    
-    # 3. Update RAM
+    # 2. Update RAM first (find_match already claimed both out of the pool),
+    #    so a second /search during the DB write sees them as chatting
     ACTIVE_CHATS[user_id] = partner_id
     ACTIVE_CHATS[partner_id] = user_id
+    SEARCH_TIMERS.cancel(user_id); SEARCH_TIMERS.cancel(partner_id)
+    
+    # 3. Now officially chatting (DB copy follows in the background)
+    USER_STATUS.set(user_id, 'chatting', partner_id)
+    USER_STATUS.set(partner_id, 'chatting', user_id)
     
     # 4. Notify
     common_str = ", ".join(common).title() if common else "Random"
@@ -706,17 +983,15 @@ async def connect_users(context, user_id, partner_id, common, p_mood, p_lang):
            f"🗣️ **Lang:** {p_lang}\n\n⚠️ *Say Hi!*")
     
     kb = get_keyboard_chat()
-    try: await context.bot.send_message(user_id, msg, reply_markup=kb, parse_mode='Markdown')
-    except: pass
-    try: await context.bot.send_message(partner_id, msg, reply_markup=kb, parse_mode='Markdown')
-    except: pass
+    for uid in (user_id, partner_id): # Queued, not awaited: the caller still holds the user's lock
+        OUTBOX.submit(uid, lambda uid=uid: context.bot.send_message(uid, msg, reply_markup=kb, parse_mode='Markdown'), PRIORITY_NOTIFY)
 
 async def stop_search_process(update, context):
     user_id = update.effective_user.id
-    conn = get_conn(); cur = conn.cursor()
     # 1. Set Status to Idle
-    cur.execute("UPDATE users SET status = 'idle' WHERE user_id = %s", (user_id,))
-    conn.commit(); cur.close(); release_conn(conn)
+    USER_STATUS.set(user_id, 'idle')
+    POOL.remove(user_id)
+    SEARCH_TIMERS.cancel(user_id)
     
     # 2. Send Feedback & Show Lobby
     try:
@@ -732,33 +1007,36 @@ async def start_search(update, context):
     # Check RAM Cache first
     if user_id in ACTIVE_CHATS:
         await update.message.reply_text("⛔ **Already in chat!**", parse_mode='Markdown'); return
-
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("UPDATE users SET status = 'searching' WHERE user_id = %s", (user_id,))
-    
-    # Fetch details for AI Context
-    cur.execute("SELECT gender, region, interests FROM users WHERE user_id = %s", (user_id,))
-    row = cur.fetchone()
-    u_gender = row[0] if row else "Hidden"
-    u_region = row[1] if row else "Unknown"
-    tags = row[2] or "Any"
-    
-    conn.commit(); cur.close(); release_conn(conn)
+    if BANS.is_banned(user_id):
+        await update.message.reply_text(f"🚫 Banned until {BANS.banned_until(user_id)}."); return
+
+    USER_STATUS.set(user_id, 'searching')
+    # Fetch details for AI Context + Match Pool
+    p = await get_profile(user_id)
+    u_gender = p['gender'] if p else "Hidden"
+    u_region = p['region'] if p else "Unknown"
+    tags = (p['interests'] if p else None) or "Any"
+
+    # Join the pool
+    if p:
+        POOL.add(user_id, p['language'], p['interest_tags'], p['age_range'], p['mood'])
     
     # Notify User
     await update.message.reply_text(f"📡 **Scanning...**\nLooking for: `{tags}`...", parse_mode='Markdown', reply_markup=get_keyboard_searching())
     
-    # 1. Try Instant Match (Human)
-    partner_id, common, p_mood, p_lang = find_match(user_id)
+    # 1. Try Instant Match (Human). In batch mode the next tick does it.
+    partner_id, common, p_mood, p_lang = None, [], "Neutral", "English"
+    if MATCH_MODE != "batch": partner_id, common, p_mood, p_lang = await find_match(user_id)
     
     if partner_id:
         # Check if partner is with AI, kick them if so
         partner_chat_state = ACTIVE_CHATS.get(partner_id)
         if isinstance(partner_chat_state, str) and partner_chat_state.startswith("AI_"):
             del ACTIVE_CHATS[partner_id]
-            conn = get_conn(); cur = conn.cursor()
-            cur.execute("UPDATE users SET status='idle' WHERE user_id = %s", (partner_id,))
-            conn.commit(); cur.close(); release_conn(conn)
+            end_ai_chat(partner_id)
+            # The claim took me out of the pool too -> I'm still waiting, so back in
+            if p: POOL.add(user_id, p['language'], p['interest_tags'], p['age_range'], p['mood'])
+            USER_STATUS.set(partner_id, 'idle')
             
             # Send Disconnect screen to the person who was talking to AI
             kb_feedback = [
@@ -776,19 +1054,17 @@ async def start_search(update, context):
             await connect_users(context, user_id, partner_id, common, p_mood, p_lang)
             return 
 
-    # 2. Schedule AI Fallback (15s) - NEW ASYNCIO METHOD
-    asyncio.create_task(execute_ghost_search(context, user_id, u_gender, u_region))
+    # 2. Schedule AI Fallback (15s) on the shared deadline heap
+    SEARCH_TIMERS.schedule(user_id, GHOST_DELAY, (u_gender, u_region))
 async def perform_match(update, context, user_id):
-    partner_id, common, p_mood, p_lang = find_match(user_id)
+    partner_id, common, p_mood, p_lang = await find_match(user_id)
     if partner_id:
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE users SET status='chatting', partner_id=%s WHERE user_id=%s", (partner_id, user_id))
-        cur.execute("UPDATE users SET status='chatting', partner_id=%s WHERE user_id=%s", (user_id, partner_id))
-        conn.commit(); cur.close(); release_conn(conn)
-        
         # UPDATE RAM CACHE (Instant Relay)
         ACTIVE_CHATS[user_id] = partner_id
         ACTIVE_CHATS[partner_id] = user_id
+        SEARCH_TIMERS.cancel(user_id); SEARCH_TIMERS.cancel(partner_id)
+        USER_STATUS.set(user_id, 'chatting', partner_id)
+        USER_STATUS.set(partner_id, 'chatting', user_id)
         
         # DESIGN RESTORED
         common_str = ", ".join(common).title() if common else "Random"
@@ -805,8 +1081,7 @@ async def stop_chat(update, context, is_next=False):
     partner_id = ACTIVE_CHATS.pop(user_id, 0)
     
     # Cleanup
-    keys_to_remove = [k for k in MESSAGE_MAP if k[0] in (user_id, partner_id)]
-    for k in keys_to_remove: del MESSAGE_MAP[k]
+    MESSAGE_MAP.close(user_id)
     if user_id in GAME_STATES: del GAME_STATES[user_id]
 
     # IF PARTNER WAS HUMAN
@@ -814,9 +1089,9 @@ async def stop_chat(update, context, is_next=False):
         if partner_id in ACTIVE_CHATS: del ACTIVE_CHATS[partner_id]
         if partner_id in GAME_STATES: del GAME_STATES[partner_id]
         
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE users SET status='idle', partner_id=0 WHERE user_id IN (%s, %s)", (user_id, partner_id))
-        conn.commit(); cur.close(); release_conn(conn)
+        USER_STATUS.set(user_id, 'idle', 0); USER_STATUS.set(partner_id, 'idle', 0)
+        POOL.remove(user_id); POOL.remove(partner_id)
+        SEARCH_TIMERS.cancel(user_id); SEARCH_TIMERS.cancel(partner_id)
         
         # Send Feedback to Human Partner
         k_partner = [[InlineKeyboardButton("👍", callback_data=f"rate_like_{user_id}"), InlineKeyboardButton("👎", callback_data=f"rate_dislike_{user_id}")], [InlineKeyboardButton("⚠️ Report", callback_data=f"rate_report_{user_id}")]]
@@ -827,9 +1102,10 @@ async def stop_chat(update, context, is_next=False):
 
     # IF PARTNER WAS AI
     elif isinstance(partner_id, str):
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE users SET status='idle' WHERE user_id = %s", (user_id,))
-        conn.commit(); cur.close(); release_conn(conn)
+        USER_STATUS.set(user_id, 'idle')
+        end_ai_chat(user_id)
+        POOL.remove(user_id)
+        SEARCH_TIMERS.cancel(user_id)
 
     # SEND FEEDBACK BUTTONS TO ME (Preserves Illusion for AI too)
     # If AI, we use target ID "AI"
@@ -844,14 +1120,75 @@ async def stop_chat(update, context, is_next=False):
     else:
         await update.message.reply_text("😶‍🌫️ **Partner Disconnect.**", reply_markup=get_keyboard_lobby(), parse_mode='Markdown')
         await update.message.reply_text("Rate Stranger:", reply_markup=InlineKeyboardMarkup(k_me))
+async def keep_typing(bot, chat_id):
+    """'typing...' lasts ~5s on Telegram -> refresh it until cancelled."""
+    while True:
+        try: await bot.send_chat_action(chat_id=chat_id, action="typing")
+        except: pass
+        await asyncio.sleep(4)
+
+async def ghost_reply(update, context, user_id, msg_text):
+    typing, done = None, False
+    def start_typing():
+        nonlocal typing
+        # A late first token (call already timed out) must not start a typing loop nobody stops
+        if typing is None and not done: typing = asyncio.create_task(keep_typing(context.bot, user_id))
+    # Streaming: typing starts with the first token. Otherwise right away, as before.
+    if not LLM_STREAM: start_typing()
+    try:
+        result = await GHOST.process_message(user_id, msg_text, on_first_token=start_typing)
+        
+        # (Keep your existing TRIGGER handling here)
+        if result == "TRIGGER_SKIP" or result == "TRIGGER_INDIAN_MALE_BEG":
+            # ... (Handle disconnect) ...
+            await stop_chat(update, context)
+            return
+
+        if isinstance(result, dict) and result.get("type") == "text":
+            reply_text = result['content']
+            
+            # [NEW] KEYWORD SCANNER (The Doorman)
+            # If AI wants to leave, we execute the /stop command for them.
+            # Check if any trigger word is in the reply (word boundaries, compiled once)
+            is_leaving = DOORMAN.find(reply_text) is not None
+            
+            # Add a random 5% chance to just ghost without saying anything
+            is_ghosting = random.random() < 0.05
+
+            if is_leaving or is_ghosting:
+                # Send the "Bye" message first (if not ghosting)
+                if not is_ghosting:
+                    start_typing()
+                    await asyncio.sleep(result['delay'])
+                    await update.message.reply_text(reply_text)
+                
+                # Then kill the chat
+                if typing: typing.cancel()
+                await asyncio.sleep(1) 
+                await stop_chat(update, context)
+                return
+
+            # Normal Reply ('delay' is only what's left of the typing time when streaming)
+            start_typing()
+            await asyncio.sleep(result['delay'])
+            await update.message.reply_text(reply_text)
+    finally:
+        done = True
+        if typing: typing.cancel()
+
 async def relay_message(update, context):
     user_id = update.effective_user.id
     partner_id = ACTIVE_CHATS.get(user_id)
     if not partner_id: return 
+    if BANS.is_banned(user_id): return # Banned mid-chat -> nothing gets through
 
     # --- PARTNER IS AI ---
     if isinstance(partner_id, str) and partner_id.startswith("AI_"):
         msg_text = update.message.text
+        if user_id not in AI_SESSIONS:
+            # Chat restored after a restart -> same persona, fresh memory
+            p = await get_profile(user_id)
+            await GHOST.start_chat(user_id, partner_id[3:], "Hidden", {'gender': p['gender'] if p else "Hidden", 'country': p['region'] if p else "Unknown"})
         
         # 1. SPECIAL: Handle Rock Paper Scissors via Text
         if msg_text and msg_text.lower() in ['rock', 'paper', 'scissors']:
@@ -873,43 +1210,7 @@ async def relay_message(update, context):
             return
 
         # 2. Normal Text Processing (The existing logic)
-        if msg_text:
-            # ... (Existing process_message logic) ...
-            await context.bot.send_chat_action(chat_id=user_id, action="typing")
-            result = await GHOST.process_message(user_id, msg_text)
-            
-            # (Keep your existing TRIGGER handling here)
-            if result == "TRIGGER_SKIP" or result == "TRIGGER_INDIAN_MALE_BEG":
-                # ... (Handle disconnect) ...
-                await stop_chat(update, context)
-                return
-
-            if isinstance(result, dict) and result.get("type") == "text":
-                reply_text = result['content']
-                
-                # [NEW] KEYWORD SCANNER (The Doorman)
-                # If AI wants to leave, we execute the /stop command for them.
-                triggers = ["bye", "skip", "stop", "boring", "bsdk", "hat", "leave", "gtg"]
-                # Check if any trigger word is in the reply (word boundaries)
-                is_leaving = any(f" {t} " in f" {reply_text.lower()} " for t in triggers)
-                
-                # Add a random 5% chance to just ghost without saying anything
-                is_ghosting = random.random() < 0.05
-
-                if is_leaving or is_ghosting:
-                    # Send the "Bye" message first (if not ghosting)
-                    if not is_ghosting:
-                        await asyncio.sleep(result['delay'])
-                        await update.message.reply_text(reply_text)
-                    
-                    # Then kill the chat
-                    await asyncio.sleep(1) 
-                    await stop_chat(update, context)
-                    return
-
-                # Normal Reply
-                await asyncio.sleep(result['delay'])
-                await update.message.reply_text(reply_text)
+        if msg_text: await ghost_reply(update, context, user_id, msg_text)
         return
 
     # --- PARTNER IS HUMAN ---
@@ -960,16 +1261,14 @@ async def relay_message(update, context):
                 return 
 
             if update.message.text:
-                conn = get_conn(); cur = conn.cursor()
-                cur.execute("INSERT INTO chat_logs (sender_id, receiver_id, message) VALUES (%s, %s, %s)", (user_id, partner_id, update.message.text))
-                conn.commit(); cur.close(); release_conn(conn)
+                await CHAT_LOG.put((user_id, partner_id, update.message.text, datetime.datetime.now()))
             
             try:
                 reply_target_id = None
                 if update.message.reply_to_message:
-                    reply_target_id = MESSAGE_MAP.get((user_id, update.message.reply_to_message.message_id))
-                sent_msg = await update.message.copy(chat_id=partner_id, reply_to_message_id=reply_target_id)
-                if sent_msg: MESSAGE_MAP[(partner_id, sent_msg.message_id)] = update.message.message_id
+                    reply_target_id = MESSAGE_MAP.get(user_id, update.message.reply_to_message.message_id)
+                sent_msg = await OUTBOX.send(partner_id, lambda: update.message.copy(chat_id=partner_id, reply_to_message_id=reply_target_id), PRIORITY_RELAY)
+                if sent_msg: MESSAGE_MAP.add(user_id, update.message.message_id, partner_id, sent_msg.message_id)
             except: await stop_chat(update, context)
 
 # ==============================================================================
@@ -977,12 +1276,8 @@ async def relay_message(update, context):
 # ==============================================================================
 async def send_reroll_option(context: ContextTypes.DEFAULT_TYPE):
     user_id = context.job.data
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT status FROM users WHERE user_id = %s", (user_id,))
-    status = cur.fetchone()
-    
     # Only show if STILL searching
-    if status and status[0] == 'searching':
+    if USER_STATUS.get(user_id) == 'searching':
         kb = [
             [InlineKeyboardButton("🔔 Notify Me & Stop", callback_data="notify_me")],
             [InlineKeyboardButton("📡 Keep Searching", callback_data="keep_searching")]
@@ -996,24 +1291,19 @@ async def send_reroll_option(context: ContextTypes.DEFAULT_TYPE):
         )
         try: await context.bot.send_message(user_id, msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
         except: pass
-    cur.close(); release_conn(conn)
 
 async def show_profile(update, context):
     user_id = update.effective_user.id
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT language, interests, karma_score, gender, age_range, region, mood FROM users WHERE user_id = %s", (user_id,))
-    data = cur.fetchone(); cur.close(); release_conn(conn)
-    text = f"👤 **IDENTITY**\n━━━━━━━━━━━━━━━━\n🗣️ {data[0]}\n🏷️ {data[1]}\n🚻 {data[3]}\n🎂 {data[4]}\n🌍 {data[5]}\n🎭 {data[6]}\n🛡️ {data[2]}%"
+    p = await get_profile(user_id)
+    if not p: return
+    text = f"👤 **IDENTITY**\n━━━━━━━━━━━━━━━━\n🗣️ {p['language']}\n🏷️ {p['interests']}\n🚻 {p['gender']}\n🎂 {p['age_range']}\n🌍 {p['region']}\n🎭 {p['mood']}\n🛡️ {p['karma_score']}%"
     await update.message.reply_text(text, parse_mode='Markdown')
 
 async def show_main_menu(update):
     user = update.effective_user
-    # 1. Fetch Language from DB
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT language FROM users WHERE user_id = %s", (user.id,))
-    row = cur.fetchone()
-    user_lang = row[0] if row else "English"
-    cur.close(); release_conn(conn)
+    # 1. Fetch Language (profile cache)
+    p = await get_profile(user.id)
+    user_lang = p['language'] if p else "English"
 
     # 2. Generate Keyboard with that language
     kb = get_keyboard_lobby(user_lang)
@@ -1026,25 +1316,47 @@ async def show_main_menu(update):
     except: pass
 
 async def handle_report(update, context, reporter, reported):
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("UPDATE users SET report_count = report_count + 1 WHERE user_id = %s RETURNING report_count", (reported,))
-    cnt = cur.fetchone()[0]
-    cur.execute("INSERT INTO reports (reporter_id, reported_id, reason) VALUES (%s, %s, 'Report')", (reporter, reported))
-    conn.commit()
+    def file_report(cur):
+        cur.execute("UPDATE users SET report_count = report_count + 1 WHERE user_id = %s RETURNING report_count", (reported,))
+        cnt = cur.fetchone()[0]
+        cur.execute("INSERT INTO reports (reporter_id, reported_id, reason) VALUES (%s, %s, 'Report')", (reporter, reported))
+        return cnt
+    cnt = await run_db(file_report)
     if cnt >= 3:
-        cur.execute("SELECT message FROM chat_logs WHERE sender_id = %s ORDER BY timestamp DESC LIMIT 5", (reported,))
-        logs = [l[0] for l in cur.fetchall()]
+        await CHAT_LOG.flush() # Flush-before-read so the admin sees the latest messages
+        rows = await db_fetchall("SELECT message FROM chat_logs WHERE sender_id = %s ORDER BY timestamp DESC LIMIT 5", (reported,))
+        logs = [l[0] for l in rows]
         msg = f"🚨 **REPORT (3+)**\nUser: `{reported}`\nLogs: {logs}"
         kb = [[InlineKeyboardButton(f"🔨 BAN {reported}", callback_data=f"ban_user_{reported}")]]
         for a in ADMIN_IDS:
             try: await context.bot.send_message(a, msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown')
             except: pass
-    cur.close(); release_conn(conn)
 
 async def update_user(user_id, col, val):
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute(f"UPDATE users SET {col} = %s WHERE user_id = %s", (val, user_id))
-    conn.commit(); cur.close(); release_conn(conn)
+    if col == "interests":
+        # Normalize once here so matchmaking never parses the raw string
+        tags = normalize_tags(val)
+        await db_execute("UPDATE users SET interests = %s, interest_tags = %s WHERE user_id = %s", (val, tags, user_id))
+        PROFILES.update(user_id, interests=val, interest_tags=tags)
+    else:
+        await db_execute(f"UPDATE users SET {col} = %s WHERE user_id = %s", (val, user_id))
+        PROFILES.update(user_id, **{col: val})
+
+    # Keep the pool index in sync if they change profile while waiting
+    entry = POOL.get(user_id)
+    if entry and col in ("language", "interests", "age_range", "mood"):
+        fields = {"language": entry['lang'], "interests": entry['tags'], "age_range": entry['age'], "mood": entry['mood']}
+        fields[col] = normalize_tags(val) if col == "interests" else val
+        new_entry = MatchPool.make_entry(fields["language"], fields["interests"], fields["age_range"], fields["mood"])
+        new_entry['since'] = entry['since'] # Keep their place in the queue
+        POOL.add_entry(user_id, new_entry)
+
+async def destroy_media_later(bot, uid, message_id, timeout):
+    await asyncio.sleep(timeout)
+    try:
+        await bot.delete_message(chat_id=uid, message_id=message_id)
+        await bot.send_message(uid, "💣 **Media Destroyed.**")
+    except: pass
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -1077,11 +1389,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode='Markdown'
             )
             
-            # Non-blocking wait
-            await asyncio.sleep(timeout)
-            
-            await context.bot.delete_message(chat_id=uid, message_id=sent_media.message_id)
-            await context.bot.send_message(uid, "💣 **Media Destroyed.**")
+            # Self-destruct in the background, so this user's next updates don't wait on the timer
+            task = asyncio.create_task(destroy_media_later(context.bot, uid, sent_media.message_id, timeout))
+            PENDING_MEDIA[task] = (uid, sent_media.message_id)
+            task.add_done_callback(lambda t: PENDING_MEDIA.pop(t, None))
         except Exception as e:
             try: await q.edit_message_text("❌ **Expired or Error.**")
             except: pass
@@ -1096,9 +1407,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # NOTIFY ME LOGIC
     # NOTIFY ME LOGIC (Pause & Lobby)
     if data == "notify_me":
-        conn = get_conn(); cur = conn.cursor()
-        cur.execute("UPDATE users SET status = 'waiting_notify' WHERE user_id = %s", (uid,))
-        conn.commit(); cur.close(); release_conn(conn)
+        if not USER_STATUS.set(uid, 'waiting_notify'): return # Already matched meanwhile
+        POOL.remove(uid)
+        SEARCH_TIMERS.cancel(uid)
         
         await q.edit_message_text("✅ **Paused.** I'll notify you when someone joins.", parse_mode='Markdown')
         await show_main_menu(update) # Force them back to Lobby so they are ready to click Start later
@@ -1324,37 +1635,39 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except: pass
         if data == "admin_home": await admin_panel(update, context); return
         if data == "admin_users":
-            conn = get_conn(); cur = conn.cursor(); cur.execute("SELECT user_id, first_name FROM users ORDER BY joined_at DESC LIMIT 10"); users = cur.fetchall(); cur.close(); release_conn(conn)
+            users = await db_fetchall("SELECT user_id, first_name FROM users ORDER BY joined_at DESC LIMIT 10")
             msg = "📜 **Recent:**\n" + "\n".join([f"• {u[1]} (`{u[0]}`)" for u in users])
             try: await q.edit_message_text(msg, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙", callback_data="admin_home")]]), parse_mode='Markdown'); return
             except: pass
         if data == "admin_reports":
-            conn = get_conn(); cur = conn.cursor(); cur.execute("SELECT user_id, report_count FROM users WHERE report_count > 0 LIMIT 5"); users = cur.fetchall(); cur.close(); release_conn(conn)
+            users = await db_fetchall("SELECT user_id, report_count FROM users WHERE report_count > 0 LIMIT 5")
             kb = []; 
             for u in users: kb.append([InlineKeyboardButton(f"🔨 {u[0]}", callback_data=f"ban_user_{u[0]}"), InlineKeyboardButton(f"✅ {u[0]}", callback_data=f"clear_user_{u[0]}")])
             kb.append([InlineKeyboardButton("🔙", callback_data="admin_home")])
             try: await q.edit_message_text("⚠️ **Reports:**", reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown'); return
             except: pass
         if data == "admin_banlist":
-            conn = get_conn(); cur = conn.cursor(); cur.execute("SELECT user_id, banned_until FROM users WHERE banned_until > NOW() LIMIT 5"); users = cur.fetchall(); cur.close(); release_conn(conn)
+            users = await db_fetchall("SELECT user_id, banned_until FROM users WHERE banned_until > NOW() LIMIT 5")
             kb = []; 
             for u in users: kb.append([InlineKeyboardButton(f"✅ Unban {u[0]}", callback_data=f"unban_user_{u[0]}")])
             kb.append([InlineKeyboardButton("🔙", callback_data="admin_home")])
             try: await q.edit_message_text("🚫 **Bans:**", reply_markup=InlineKeyboardMarkup(kb), parse_mode='Markdown'); return
             except: pass
         if data == "admin_feedbacks":
-            conn = get_conn(); cur = conn.cursor(); cur.execute("SELECT message FROM feedback ORDER BY timestamp DESC LIMIT 5"); rows = cur.fetchall(); cur.close(); release_conn(conn)
+            rows = await db_fetchall("SELECT message FROM feedback ORDER BY timestamp DESC LIMIT 5")
             txt = "\n".join([r[0] for r in rows]) or "None"
             try: await q.edit_message_text(f"📨 **Feed:**\n{txt}", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙", callback_data="admin_home")]]), parse_mode='Markdown'); return
             except: pass
         
         if data.startswith("ban_user_"): await admin_ban_command(update, context); return
         if data.startswith("clear_user_"):
-            tid = int(data.split("_")[2]); conn = get_conn(); cur = conn.cursor(); cur.execute("UPDATE users SET report_count = 0 WHERE user_id = %s", (tid,)); conn.commit(); cur.close(); release_conn(conn)
+            tid = int(data.split("_")[2]); await db_execute("UPDATE users SET report_count = 0 WHERE user_id = %s", (tid,))
             try: await q.edit_message_text(f"✅ Cleared.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙", callback_data="admin_reports")]])); return
             except: pass
         if data.startswith("unban_user_"):
-            tid = int(data.split("_")[2]); conn = get_conn(); cur = conn.cursor(); cur.execute("UPDATE users SET banned_until = NULL WHERE user_id = %s", (tid,)); conn.commit(); cur.close(); release_conn(conn)
+            tid = int(data.split("_")[2]); await db_execute("UPDATE users SET banned_until = NULL WHERE user_id = %s", (tid,))
+            PROFILES.update(tid, banned_until=None)
+            BANS.unban(tid)
             try: await q.edit_message_text("✅ Unbanned.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙", callback_data="admin_banlist")]])); return
             except: pass
 
@@ -1376,27 +1689,105 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await q.edit_message_text("⚠️ Reported.")
         else:
             sc = 1 if act == "like" else -1
-            conn = get_conn(); cur = conn.cursor()
-            cur.execute("INSERT INTO user_interactions (rater_id, target_id, score) VALUES (%s, %s, %s)", (uid, target, sc))
-            conn.commit(); cur.close(); release_conn(conn)
+            await db_execute("INSERT INTO user_interactions (rater_id, target_id, score) VALUES (%s, %s, %s)", (uid, target, sc))
+            if sc == -1: DISLIKES.add(uid, target)
             await q.edit_message_text("✅ Sent.")
     
     if data == "action_search": await start_search(update, context); return
     if data == "main_menu": await show_main_menu(update); return
     if data == "stop_search": await stop_search_process(update, context); return
+async def graceful_shutdown(application):
+    """
+    post_stop: polling / webhook intake and update handlers are already stopped.
+    Drains what's queued within SHUTDOWN_DEADLINE, then marks everyone offline in one UPDATE.
+    A crash never gets here -> restore_state() picks the chats back up on boot instead.
+    """
+    t0 = time.perf_counter()
+    left = lambda: max(0.1, SHUTDOWN_DEADLINE - (time.perf_counter() - t0))
+    bot = application.bot
+
+    # 1. Nothing new starts: pending AI fallbacks are dropped
+    SEARCH_TIMERS.active.clear()
+    for t in list(GHOST_TASKS): t.cancel()
+
+    # 2. Secret media can't outlive us -> destroy it now
+    media = list(PENDING_MEDIA.values())
+    for t in list(PENDING_MEDIA): t.cancel()
+    for uid, mid in media:
+        OUTBOX.submit(uid, lambda uid=uid, mid=mid: bot.delete_message(chat_id=uid, message_id=mid), PRIORITY_RELAY)
+
+    # 3. Tell everyone in a chat (human or AI) that it's over
+    chatters = list(ACTIVE_CHATS)
+    msg = "🔧 **Bot is restarting.** Your chat has ended, tap Start again in a minute."
+    for uid in chatters:
+        OUTBOX.submit(uid, lambda uid=uid: bot.send_message(uid, msg, reply_markup=get_keyboard_lobby(), parse_mode='Markdown'), PRIORITY_NOTIFY)
+    try: await asyncio.wait_for(OUTBOX.drain(), left())
+    except asyncio.TimeoutError: print(f"⚠️ Shutdown: {sum(OUTBOX.depth().values())} sends dropped")
+
+    # 4. Buffered DB writes, then everybody offline in one statement
+    for writer in (CHAT_LOG, STATUS_LOG, AI_CHAT_LOG):
+        try: await asyncio.wait_for(writer.flush(), left())
+        except asyncio.TimeoutError: print(f"⚠️ Shutdown: {len(writer)} {writer.name} rows dropped")
+    def reset_all(cur):
+        cur.execute("""UPDATE users SET status = 'idle', partner_id = 0, ai_persona = NULL
+                       WHERE status IN ('searching', 'chatting') OR ai_persona IS NOT NULL""")
+        return cur.rowcount
+    try: reset = await asyncio.wait_for(run_db(reset_all), left())
+    except Exception as e: reset = f"failed ({e})"
+
+    print(f"👋 Shutdown in {(time.perf_counter() - t0) * 1000:.0f}ms: {len(chatters)} in chats notified, "
+          f"{len(media)} media destroyed, {reset} users reset")
+
+async def run_webhook_mode(app):
+    """Like run_polling, but updates arrive via Flask's /telegram route on PORT."""
+    global BOT_APP, BOT_LOOP
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM): loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    if app.post_init: await app.post_init(app)
+    await app.bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+    await app.start()
+    BOT_APP, BOT_LOOP = app, loop
+    try:
+        await stop.wait()
+    finally:
+        BOT_APP = None # Stop accepting POSTs; Telegram keeps them until we're back
+        await app.stop()
+        if app.post_stop: await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown: await app.post_shutdown(app)
+
 if __name__ == '__main__':
     if not BOT_TOKEN: print("ERROR: Config missing")
     else:
         init_db()
         flask_thread = threading.Thread(target=run_flask); flask_thread.daemon = True; flask_thread.start()
         req = HTTPXRequest(connect_timeout=60, read_timeout=60)
-        app = ApplicationBuilder().token(BOT_TOKEN).request(req).build()
+        async def post_init(application):
+            # The single task that drives every search timeout
+            asyncio.create_task(SEARCH_TIMERS.run(lambda uid, data: on_search_timeout(application.bot, uid, data)))
+            for uid, u_gender, u_region in RESTORED_SEARCHERS: SEARCH_TIMERS.schedule(uid, GHOST_DELAY, (u_gender, u_region))
+            RESTORED_SEARCHERS.clear()
+            asyncio.create_task(CHAT_LOG.run())
+            asyncio.create_task(STATUS_LOG.run())
+            asyncio.create_task(AI_CHAT_LOG.run())
+            asyncio.create_task(OUTBOX.run())
+        app = (ApplicationBuilder().token(BOT_TOKEN).request(req).concurrent_updates(UPDATE_PROCESSOR)
+               .post_init(post_init).post_stop(graceful_shutdown).build())
+        app.job_queue.run_repeating(evict_idle_caches, interval=300, first=300)
+        app.job_queue.run_repeating(expire_bans, interval=60, first=60)
+        if MATCH_MODE == "batch":
+            app.job_queue.run_repeating(batch_match_tick, interval=MATCH_TICK, first=MATCH_TICK)
         
+        app.add_handler(TypeHandler(Update, track_ingest), group=-1)
         app.add_handler(CommandHandler("start", start))
         app.add_handler(CommandHandler("admin", admin_panel))
         app.add_handler(CommandHandler("ban", admin_ban_command))
         app.add_handler(CommandHandler("warn", admin_warn_command))
         app.add_handler(CommandHandler("broadcast", admin_broadcast_execute))
+        app.add_handler(CommandHandler("reload_personas", admin_reload_personas))
         app.add_handler(CommandHandler("help", help_command))
         app.add_handler(CommandHandler("feedback", handle_feedback_command))
         
@@ -1405,5 +1796,6 @@ if __name__ == '__main__':
         app.add_handler(CallbackQueryHandler(button_handler))
         app.add_handler(MessageHandler(filters.ALL, relay_message))
         
-        print("🤖 PHASE 20 BOT LIVE")
-        app.run_polling()
+        print(f"🤖 PHASE 20 BOT LIVE ({UPDATE_MODE})")
+        if UPDATE_MODE == "webhook": asyncio.run(run_webhook_mode(app))
+        else: app.run_polling() # Fallback: also clears any webhook left from a webhook deploy
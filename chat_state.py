@@ -0,0 +1,128 @@
+# chat_state.py
+# 💬 PER-CHAT STATE
+# Everything here is keyed by the chat it belongs to, so tearing a chat down
+# costs O(that chat) instead of a scan over every chat in the process.
+import logging
+import sys
+from array import array
+
+
+class ChatReplies:
+    """
+    Reply threading for ONE chat: a fixed ring of (msg id on A's side, msg id on
+    B's side) pairs plus a lookup per side. Once 'cap' messages are mapped the
+    oldest pair is dropped, so a chat can never grow past 'cap'.
+    """
+    def __init__(self, user_a, user_b, cap):
+        self.users = (user_a, user_b)
+        self.cap = cap
+        self.ring = (array('q'), array('q'))  # Grows up to 'cap', then wraps
+        self.lookup = ({}, {})   # per side: {msg_id in that user's chat: slot}
+        self.head = 0            # Next slot to overwrite once full
+
+    def side(self, user_id):
+        return 0 if user_id == self.users[0] else 1
+
+    def add(self, sender, sender_msg, receiver_msg):
+        s = self.side(sender)
+        if len(self.ring[0]) < self.cap:
+            slot = len(self.ring[0])
+            self.ring[0].append(0); self.ring[1].append(0)
+        else:
+            # Ring is full -> forget the oldest pair on both sides
+            slot = self.head
+            self.head = (slot + 1) % self.cap
+            for side in (0, 1):
+                old = self.ring[side][slot]
+                if self.lookup[side].get(old) == slot: del self.lookup[side][old]
+        self.ring[s][slot], self.ring[1 - s][slot] = sender_msg, receiver_msg
+        self.lookup[s][sender_msg] = slot
+        self.lookup[1 - s][receiver_msg] = slot
+
+    def counterpart(self, user_id, msg_id):
+        """msg_id as seen by user_id -> the same message in the partner's chat."""
+        s = self.side(user_id)
+        slot = self.lookup[s].get(msg_id)
+        return None if slot is None else self.ring[1 - s][slot]
+
+    def nbytes(self):
+        return (sum(sys.getsizeof(r) for r in self.ring) + sum(sys.getsizeof(l) for l in self.lookup)
+                + sys.getsizeof(self))
+
+
+class ReplyMap:
+    """Replaces the flat MESSAGE_MAP: {user_id: ChatReplies}, both users share one object."""
+    def __init__(self, cap_per_chat=500):
+        self.cap_per_chat = cap_per_chat
+        self.chats = {}
+
+    def add(self, sender, sender_msg, receiver, receiver_msg):
+        chat = self.chats.get(sender)
+        if chat is None or receiver not in chat.users:
+            # First message of this chat (or a leftover from an old one)
+            self.close(sender); self.close(receiver)
+            chat = self.chats[sender] = self.chats[receiver] = ChatReplies(sender, receiver, self.cap_per_chat)
+        chat.add(sender, sender_msg, receiver_msg)
+
+    def get(self, user_id, msg_id):
+        chat = self.chats.get(user_id)
+        return chat.counterpart(user_id, msg_id) if chat else None
+
+    def close(self, user_id):
+        """Chat over -> drop its mappings for both users. O(1)."""
+        chat = self.chats.pop(user_id, None)
+        if chat:
+            for u in chat.users:
+                if self.chats.get(u) is chat: del self.chats[u]
+
+    def stats(self):
+        chats = {id(c): c for c in self.chats.values()}.values()
+        total = sum(c.nbytes() for c in chats)
+        n = len(chats)
+        return {"chats": n, "bytes": total, "bytes_per_chat": total // n if n else 0}
+
+
+# Who may go where. Users talking to the AI stay 'searching' (they're still in the pool).
+TRANSITIONS = {
+    'idle':           {'idle', 'searching', 'waiting_notify'},
+    'searching':      {'searching', 'chatting', 'idle', 'waiting_notify'},
+    'chatting':       {'idle'},
+    'waiting_notify': {'waiting_notify', 'searching', 'idle'},
+}
+
+
+class UserStatus:
+    """
+    Authoritative idle / searching / chatting / waiting_notify per user, in RAM.
+    users.status in Postgres is only a write-behind copy (see on_change).
+    Only non-idle users are stored, so memory follows who is online.
+    """
+    def __init__(self, on_change=None):
+        self.status = {}            # {user_id: status}  (absent = 'idle')
+        self.on_change = on_change  # fn(user_id, status, partner_id) after every accepted move
+        self.illegal = 0
+
+    def get(self, user_id):
+        return self.status.get(user_id, 'idle')
+
+    def set(self, user_id, new, partner_id=None):
+        """Moves user_id to 'new'. Illegal moves are logged and refused -> False."""
+        old = self.get(user_id)
+        if new not in TRANSITIONS.get(old, ()):
+            self.illegal += 1
+            logging.warning("Illegal status transition for %s: %s -> %s", user_id, old, new)
+            return False
+        if new == 'idle': self.status.pop(user_id, None)
+        else: self.status[user_id] = new
+        if self.on_change: self.on_change(user_id, new, partner_id)
+        return True
+
+    def load(self, rows):
+        """Startup: trust the DB copy as-is, [(user_id, status), ...]."""
+        for user_id, status in rows:
+            if status in TRANSITIONS and status != 'idle': self.status[user_id] = status
+
+    def counts(self):
+        out = {s: 0 for s in TRANSITIONS if s != 'idle'}
+        for s in self.status.values(): out[s] += 1
+        return out
@@ -0,0 +1,61 @@
+# dislike_cache.py
+# 👎 DISLIKE CACHE
+# Who each user has disliked, so matchmaking never queries user_interactions
+# for it. Sets are loaded on a user's first search (or in one query per batch
+# tick), updated inline by the 👎 button and forgotten once the user goes idle.
+import sys
+import time
+
+
+class DislikeCache:
+    """
+    Per-user set of disliked target ids. Loaded lazily from user_interactions,
+    updated inline when a 👎 is sent, dropped after 'idle_ttl' seconds unused.
+    """
+    def __init__(self, idle_ttl=1800):
+        self.idle_ttl = idle_ttl
+        self.sets = {}       # {rater_id: {target_id, ...}}
+        self.last_used = {}  # {rater_id: timestamp}
+        self.pending = {}    # {rater_id: {target_id, ...}} 👎s sent before the set was loaded
+
+    def __contains__(self, user_id):
+        return user_id in self.sets
+
+    def get(self, user_id):
+        """The cached set, or None if it has to be loaded first."""
+        found = self.sets.get(user_id)
+        if found is not None: self.last_used[user_id] = time.time()
+        return found
+
+    def put(self, user_id, targets):
+        # Union with what add() saw meanwhile: a 👎 committed after the load's SELECT
+        # is in neither the rows nor (until now) the cache
+        found = self.sets.setdefault(user_id, set())
+        found |= set(targets)
+        found |= self.pending.pop(user_id, set())
+        self.last_used[user_id] = time.time()
+        return found
+
+    def add(self, user_id, target_id):
+        # Not loaded yet -> keep it for put(), a load may already be past its SELECT
+        if user_id in self.sets: self.sets[user_id].add(target_id)
+        else:
+            self.pending.setdefault(user_id, set()).add(target_id)
+            self.last_used[user_id] = time.time()
+
+    def evict_idle(self, now=None):
+        now = now or time.time()
+        stale = [u for u, t in self.last_used.items() if now - t > self.idle_ttl]
+        for u in stale:
+            self.sets.pop(u, None)
+            self.pending.pop(u, None) # Never loaded: the DB has it by now
+            del self.last_used[u]
+        return len(stale)
+
+    def stats(self):
+        users = len(self.sets)
+        entries = sum(len(s) for s in self.sets.values())
+        # Approximate: the set objects + their int members + the two dict slots
+        size = sum(sys.getsizeof(s) + sum(sys.getsizeof(t) for t in s) for s in self.sets.values())
+        size += sys.getsizeof(self.sets) + sys.getsizeof(self.last_used)
+        return {"users": users, "entries": entries, "bytes": size, "bytes_per_user": size // users if users else 0}
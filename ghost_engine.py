@@ -2,7 +2,12 @@ import os
 import random
 import time
 import asyncio
+from collections import deque, namedtuple
+from types import MappingProxyType
 from groq import Groq
+from triggers import SKIP_MATCHERS, SUSPICIOUS
+from llm_pool import LLMPool, LLMOverloaded
+from quick_replies import QuickReplies
 from psycopg2 import pool
 
 # CONFIG
@@ -11,42 +16,110 @@ CLIENT = None
 if GROQ_API_KEY:
     CLIENT = Groq(api_key=GROQ_API_KEY)
 
-AI_SESSIONS = {} 
-
-# ==============================================================================
-# 🚫 THE KILL SWITCH (Skip Trigger Lists)
-# ==============================================================================
-SKIP_TRIGGERS = {
-    # 1. HATES_MEN: Used by Male personas to skip other males
-    "hates_men": [
-        " m ", "male", "boy", "man", "guy", "dude", "bro", "bhai", 
-        "m 21", "m 22", "m 23", "m 24", "m 18", "m 19", "uncle", "grandpa",
-        "m here", "im m", "i am m", "bye", "byy", "bot"
-    ],
-    # 2. ZERO: Strict girls (Nisha, etc.) - Skips ANY flirt/vulgarity
-    "zero": [
-        "sex", "horny", "nude", "bobs", "vegana", "pics", "cam", "video", 
-        "sexy", "hot", "dick", "cock", "fuck", 
-        "suck", "meet", "number", "whatsapp", "date", 
-        "snap", "porn", "chut", "lund", "chudai", "bye", "bot"
-    ],
-    # 3. MEDIUM: Normal girls - Skips direct vulgarity/demands
-    "medium": [
-        "nude", "naked", "bobs", "vegana", "dick", "cock", 
-        "pussy", "fuck", "suck", "pay", "money", "rate", "cam", "video call", "vc", "bye", "bot"
-    ],
-    # 4. HIGH: Spicy girls (Ayu, etc.) - Only skips RED LINES
-    "high": [
-        "nude", "naked", "topless", "open cloth", "strip", "price", 
-        "pay", "rate", "cam", "video", "vc", 
-        "rape", "force", "cp", "porn", "bye", "bot"
-    ]
-}
+class SessionStore:
+    """
+    AI chat sessions, {user_id: session dict}. A session ends explicitly
+    (end(), called by the bot when the chat stops) or after 'idle_ttl' seconds
+    without a message. History is a ring of the last HISTORY_LEN turns with
+    each turn capped at 'max_chars', so one session can't grow past a few KB.
+    """
+    HISTORY_LEN = 6 # Exactly what gets sent to the LLM
+
+    def __init__(self, idle_ttl=1800, max_chars=500):
+        self.idle_ttl = idle_ttl
+        self.max_chars = max_chars
+        self.sessions = {}
+        self.stats = {"started": 0, "ended": 0, "evicted": 0}
+
+    def __contains__(self, user_id):
+        return user_id in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def start(self, user_id, persona_key, system_msg, tolerance):
+        self.sessions[user_id] = {
+            'persona': persona_key,
+            'system': system_msg,
+            'tolerance': tolerance, # Store for skip logic
+            'history': deque(maxlen=self.HISTORY_LEN),
+            'seen': time.monotonic()
+        }
+        self.stats["started"] += 1
+
+    def get(self, user_id):
+        session = self.sessions.get(user_id)
+        if session: session['seen'] = time.monotonic()
+        return session
+
+    def remember(self, session, role, content):
+        session['history'].append({"role": role, "content": content[:self.max_chars]})
+
+    def end(self, user_id):
+        if self.sessions.pop(user_id, None) is not None: self.stats["ended"] += 1
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for uid in [u for u, s in self.sessions.items() if s['seen'] < cutoff]:
+            del self.sessions[uid]
+            self.stats["evicted"] += 1
+
+    def nbytes(self):
+        return sum(len(s['system']) + sum(len(m['content']) for m in s['history']) for s in self.sessions.values())
+
+AI_SESSIONS = SessionStore(idle_ttl=int(os.getenv("AI_SESSION_TTL", 1800)))
+
+# LLM POOL LIMITS (see llm_pool.py). Shed mode: 'fallback' = cheap canned reply, 'skip' = say nothing
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", 8))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 32))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 20))
+LLM_SHED_MODE = os.getenv("LLM_SHED_MODE", "fallback")
+# LLM_STREAM=1: stream tokens, show 'typing' from the first one and let the typing delay overlap generation
+LLM_STREAM = os.getenv("LLM_STREAM", "0") == "1"
+FALLBACK_REPLIES = ["hm", "wait", "lol", "?", "hmm", "wdym", "ok and", "sry net slow"]
+
+# gender ('m' / 'f') and age are what the persona says about itself; None = the prompt doesn't say
+Persona = namedtuple("Persona", "key display_name system_prompt tolerance gender age")
+PERSONA_SQL = "SELECT key_name, display_name, system_prompt, tolerance, gender, age FROM ai_personas"
+
+def build_catalog(rows):
+    """Read-only {key: Persona}. Replaced wholesale on reload, never mutated."""
+    return MappingProxyType({r[0]: Persona(r[0], r[1], r[2], r[3] or 'medium', r[4], r[5]) for r in rows})
 
 class GhostEngine:
-    def __init__(self, db_pool):
+    def __init__(self, db_pool, db_executor=None):
         self.db_pool = db_pool
+        self.db_executor = db_executor # Shared with bot.py so queries never block the loop
+        self.llm = LLMPool(LLM_MAX_INFLIGHT, LLM_MAX_QUEUE, LLM_DEADLINE)
+        self.quick = QuickReplies() # Openers ('hi', 'asl', 'm or f'...) answered without the LLM
+        self.catalog = MappingProxyType({})
+        self.persona_keys = ()
         self._init_db()
+        self._set_catalog(self._fetch(PERSONA_SQL))
+
+    def _set_catalog(self, rows):
+        catalog = build_catalog(rows)
+        # One assignment each -> readers see the old catalog or the new one, never a mix
+        self.catalog, self.persona_keys = catalog, tuple(catalog)
+
+    async def reload_personas(self):
+        """Admin refresh after editing ai_personas. Returns how many are loaded."""
+        self._set_catalog(await self._fetch_async(PERSONA_SQL))
+        return len(self.persona_keys)
+
+    def _fetch(self, sql, params=(), one=False):
+        conn = self.db_pool.getconn()
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params)
+            return cur.fetchone() if one else cur.fetchall()
+        finally:
+            cur.close()
+            self.db_pool.putconn(conn)
+
+    async def _fetch_async(self, sql, params=(), one=False):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, self._fetch, sql, params, one)
 
     def _init_db(self):
         conn = self.db_pool.getconn()
@@ -59,13 +132,17 @@ class GhostEngine:
                 key_name TEXT UNIQUE,
                 display_name TEXT,
                 system_prompt TEXT,
-                tolerance TEXT DEFAULT 'medium'
+                tolerance TEXT DEFAULT 'medium',
+                gender TEXT,
+                age INTEGER
             );
         """)
         
-        # 2. Migration: Ensure 'tolerance' column exists if table was old
+        # 2. Migration: Ensure 'tolerance' / 'gender' / 'age' columns exist if table was old
         try:
             cur.execute("ALTER TABLE ai_personas ADD COLUMN IF NOT EXISTS tolerance TEXT DEFAULT 'medium';")
+            cur.execute("ALTER TABLE ai_personas ADD COLUMN IF NOT EXISTS gender TEXT;")
+            cur.execute("ALTER TABLE ai_personas ADD COLUMN IF NOT EXISTS age INTEGER;")
         except:
             conn.rollback()
         
@@ -85,111 +162,101 @@ class GhostEngine:
         # ==============================================================================
         personas = [
             # --- 🇮🇳 INDIAN MALES (Hates Men) ---
-            ('rahul_delhi', 'Rahul (Delhi)', 'You are Rahul, 21, Engineering student from Delhi. Frustrated. Use "Bhai", "Bro". Looking for girls only. If partner is male, skip instantly.', 'hates_men'),
-            ('arjun_mumbai', 'Arjun (Mumbai)', 'You are Arjun, 24, from Mumbai. Work in call center. Tired. Use "Bro", "Scene kya hai". Hate boring people.', 'hates_men'),
-            ('karthik_blr', 'Karthik (Bangalore)', 'You are Karthik, 23, IT guy. Use "Macha", "Da". Polite but brief. Hates vulgarity.', 'hates_men'),
-            ('vihaan_pune', 'Vihaan (Pune)', 'You are Vihaan, 19. Gamer. Short replies. "sup", "nm". Hates small talk.', 'hates_men'),
-            ('amit_bihar', 'Amit (Bihar)', 'You are Amit, 25. Simple English mixed with Hindi. Trying to learn English. Polite but aggressive if mocked.', 'hates_men'),
+            ('rahul_delhi', 'Rahul (Delhi)', 'You are Rahul, 21, Engineering student from Delhi. Frustrated. Use "Bhai", "Bro". Looking for girls only. If partner is male, skip instantly.', 'hates_men', 'm', 21),
+            ('arjun_mumbai', 'Arjun (Mumbai)', 'You are Arjun, 24, from Mumbai. Work in call center. Tired. Use "Bro", "Scene kya hai". Hate boring people.', 'hates_men', 'm', 24),
+            ('karthik_blr', 'Karthik (Bangalore)', 'You are Karthik, 23, IT guy. Use "Macha", "Da". Polite but brief. Hates vulgarity.', 'hates_men', 'm', 23),
+            ('vihaan_pune', 'Vihaan (Pune)', 'You are Vihaan, 19. Gamer. Short replies. "sup", "nm". Hates small talk.', 'hates_men', 'm', 19),
+            ('amit_bihar', 'Amit (Bihar)', 'You are Amit, 25. Simple English mixed with Hindi. Trying to learn English. Polite but aggressive if mocked.', 'hates_men', 'm', 25),
 
             # --- 🇮🇳 INDIAN FEMALES (Strict/Zero) ---
-            ('nisha_delhi', 'Nisha (Delhi)', 'You are Nisha, 22, MSc Student Delhi Univ. Mature. Love Music. HATE vulgarity. If someone says "sexy" or "bobs", disconnect.', 'zero'),
-            ('riya_sobo', 'Riya (Mumbai)', 'You are Riya, 20, SoBo fashion student. Rich, slightly arrogant. Use "Ew", "No". Hate creeps.', 'zero'),
-            ('sneha_kerala', 'Sneha (Kerala)', 'You are Sneha, 24, Nurse. Conservative. Polite. If they flirt too fast, say bye.', 'zero'),
+            ('nisha_delhi', 'Nisha (Delhi)', 'You are Nisha, 22, MSc Student Delhi Univ. Mature. Love Music. HATE vulgarity. If someone says "sexy" or "bobs", disconnect.', 'zero', 'f', 22),
+            ('riya_sobo', 'Riya (Mumbai)', 'You are Riya, 20, SoBo fashion student. Rich, slightly arrogant. Use "Ew", "No". Hate creeps.', 'zero', 'f', 20),
+            ('sneha_kerala', 'Sneha (Kerala)', 'You are Sneha, 24, Nurse. Conservative. Polite. If they flirt too fast, say bye.', 'zero', 'f', 24),
 
             # --- 🇮🇩 INDO GIRLS (Medium/High) ---
-            ('putri_jkt', 'Putri (Jakarta)', 'You are Putri, 18. Gen Z Indo. Use "wkwk", "anjir". Fast typer. If they dont speak Indo, be bored.', 'medium'),
-            ('dewi_bandung', 'Dewi (Bandung)', 'You are Dewi, 21, Uni student. Polite. Use "kak". Sweet but guarded.', 'medium'),
-            ('indah_bali', 'Indah (Bali)', 'You are Indah, 23. Tourism worker. Good English. Hate people asking for hotels.', 'medium'),
-            ('ayu_naughty', 'Ayu (Indo Spicy)', 'You are Ayu, highschooler. Naughty but safe. Teasing. Use "wkwk", "sange" if safe. Like "50 Shades". NO NUDES.', 'high'),
+            ('putri_jkt', 'Putri (Jakarta)', 'You are Putri, 18. Gen Z Indo. Use "wkwk", "anjir". Fast typer. If they dont speak Indo, be bored.', 'medium', 'f', 18),
+            ('dewi_bandung', 'Dewi (Bandung)', 'You are Dewi, 21, Uni student. Polite. Use "kak". Sweet but guarded.', 'medium', 'f', 21),
+            ('indah_bali', 'Indah (Bali)', 'You are Indah, 23. Tourism worker. Good English. Hate people asking for hotels.', 'medium', 'f', 23),
+            ('ayu_naughty', 'Ayu (Indo Spicy)', 'You are Ayu, highschooler. Naughty but safe. Teasing. Use "wkwk", "sange" if safe. Like "50 Shades". NO NUDES.', 'high', 'f', None),
 
             # --- 🇲🇾 MALAY & 🇸🇬 SINGAPORE (Mixed) ---
-            ('aishah_kl', 'Aishah (KL)', 'You are Aishah, 20. Malay. Conservative but fun. Use "lah".', 'zero'),
-            ('mel_kl', 'Mel (KL)', 'You are Mel, 22. Chinese Malay. Party girl. Open minded. Use "meh", "can".', 'high'),
-            ('sarah_sg', 'Sarah (SG)', 'You are Sarah, 19, Student. Stressed. Singlish: "Lor", "Sian". Strict.', 'medium'),
-            ('chloe_sg', 'Chloe (SG)', 'You are Chloe, 24. Office worker. Bored. Singlish.', 'medium'),
-            ('kevin_sg', 'Kevin (SG)', 'You are Kevin, 20. Army (NS). Bored. Skip men.', 'hates_men'),
-            ('jason_sg', 'Jason (SG)', 'You are Jason, 16. Student. Gamer. Toxic.', 'hates_men'),
+            ('aishah_kl', 'Aishah (KL)', 'You are Aishah, 20. Malay. Conservative but fun. Use "lah".', 'zero', 'f', 20),
+            ('mel_kl', 'Mel (KL)', 'You are Mel, 22. Chinese Malay. Party girl. Open minded. Use "meh", "can".', 'high', 'f', 22),
+            ('sarah_sg', 'Sarah (SG)', 'You are Sarah, 19, Student. Stressed. Singlish: "Lor", "Sian". Strict.', 'medium', 'f', 19),
+            ('chloe_sg', 'Chloe (SG)', 'You are Chloe, 24. Office worker. Bored. Singlish.', 'medium', 'f', 24),
+            ('kevin_sg', 'Kevin (SG)', 'You are Kevin, 20. Army (NS). Bored. Skip men.', 'hates_men', 'm', 20),
+            ('jason_sg', 'Jason (SG)', 'You are Jason, 16. Student. Gamer. Toxic.', 'hates_men', 'm', 16),
 
             # --- 🇺🇸 USA (Medium/Hates Men/High) ---
-            ('jessica_la', 'Jessica (LA)', 'You are Jessica, 21. Vocal fry text. "literally", "omg". Bored.', 'medium'),
-            ('ashley_texas', 'Ashley (Texas)', 'You are Ashley, 23. Polite. "Yall". Friendly.', 'medium'),
-            ('emily_nyc', 'Emily (NYC)', 'You are Emily, 25. Busy, rude. Fast replies.', 'medium'),
-            ('mia_florida', 'Mia (FL)', 'You are Mia, 19. Party girl. "lol", "idk".', 'medium'),
-            ('sarah_midwest', 'Sarah (US)', 'You are Sarah, 28. Mom vibes. Bored.', 'medium'),
-            ('lexi_miami', 'Lexi (Spicy)', 'You are Lexi, 19. College wild child. Flirty. "lmao", "fr". Hate creeps but likes bad boys.', 'high'),
-            ('mike_usa', 'Mike (USA)', 'You are Mike, 22. Frat bro. "dude", "bro". Skip men.', 'hates_men'),
-            ('chris_usa', 'Chris (USA)', 'You are Chris, 16. Gamer. Toxic.', 'hates_men'),
+            ('jessica_la', 'Jessica (LA)', 'You are Jessica, 21. Vocal fry text. "literally", "omg". Bored.', 'medium', 'f', 21),
+            ('ashley_texas', 'Ashley (Texas)', 'You are Ashley, 23. Polite. "Yall". Friendly.', 'medium', 'f', 23),
+            ('emily_nyc', 'Emily (NYC)', 'You are Emily, 25. Busy, rude. Fast replies.', 'medium', 'f', 25),
+            ('mia_florida', 'Mia (FL)', 'You are Mia, 19. Party girl. "lol", "idk".', 'medium', 'f', 19),
+            ('sarah_midwest', 'Sarah (US)', 'You are Sarah, 28. Mom vibes. Bored.', 'medium', 'f', 28),
+            ('lexi_miami', 'Lexi (Spicy)', 'You are Lexi, 19. College wild child. Flirty. "lmao", "fr". Hate creeps but likes bad boys.', 'high', 'f', 19),
+            ('mike_usa', 'Mike (USA)', 'You are Mike, 22. Frat bro. "dude", "bro". Skip men.', 'hates_men', 'm', 22),
+            ('chris_usa', 'Chris (USA)', 'You are Chris, 16. Gamer. Toxic.', 'hates_men', 'm', 16),
 
             # --- 🌍 AFRICAN ---
-            ('david_ng', 'David (Nigeria)', 'You are David, 24. Hustler. "How far", "My guy". Skip men.', 'hates_men'),
-            ('samuel_sa', 'Samuel (SA)', 'You are Samuel, 26. Chill. "Bru", "Howzit".', 'hates_men'),
-            ('amina_ng', 'Amina (Nigeria)', 'You are Amina, 21. Sassy. Strict. No nonsense.', 'zero'),
-            ('zuri_ke', 'Zuri (Kenya)', 'You are Zuri, 23. Swahili mix "Poa". Friendly.', 'medium'),
+            ('david_ng', 'David (Nigeria)', 'You are David, 24. Hustler. "How far", "My guy". Skip men.', 'hates_men', 'm', 24),
+            ('samuel_sa', 'Samuel (SA)', 'You are Samuel, 26. Chill. "Bru", "Howzit".', 'hates_men', 'm', 26),
+            ('amina_ng', 'Amina (Nigeria)', 'You are Amina, 21. Sassy. Strict. No nonsense.', 'zero', 'f', 21),
+            ('zuri_ke', 'Zuri (Kenya)', 'You are Zuri, 23. Swahili mix "Poa". Friendly.', 'medium', 'f', 23),
 
             # --- 🇳🇵 NEPAL & 🇧🇩 BANGLA ---
-            ('anusha_nepal', 'Anusha (Nepal)', 'You are Anusha, 20. Kathmandu. "Namaste". Sweet.', 'high'),
-            ('priti_nepal', 'Priti (Nepal)', 'You are Priti, 18. Pokhara. Chill. "k cha".', 'medium'),
-            ('fatema_bd', 'Fatema (BD)', 'You are Fatema, 22. Dhaka. Strict. Conservative. Zero flirting.', 'zero'),
+            ('anusha_nepal', 'Anusha (Nepal)', 'You are Anusha, 20. Kathmandu. "Namaste". Sweet.', 'high', 'f', 20),
+            ('priti_nepal', 'Priti (Nepal)', 'You are Priti, 18. Pokhara. Chill. "k cha".', 'medium', 'f', 18),
+            ('fatema_bd', 'Fatema (BD)', 'You are Fatema, 22. Dhaka. Strict. Conservative. Zero flirting.', 'zero', 'f', 22),
 
             # --- 🇸🇦 MIDDLE EAST ---
-            ('ahmed_dubai', 'Ahmed (Dubai)', 'You are Ahmed, 25. Rich. "Habibi". Skip men.', 'hates_men'),
-            ('omar_saudi', 'Omar (Saudi)', 'You are Omar, 22. Student. Bored.', 'hates_men'),
+            ('ahmed_dubai', 'Ahmed (Dubai)', 'You are Ahmed, 25. Rich. "Habibi". Skip men.', 'hates_men', 'm', 25),
+            ('omar_saudi', 'Omar (Saudi)', 'You are Omar, 22. Student. Bored.', 'hates_men', 'm', 22),
 
             # --- 🇪🇺 EUROPE ---
-            ('tom_uk', 'Tom (UK)', 'You are Tom, 21. Roadman slang "innit", "wagwan". Skip men.', 'hates_men'),
-            ('hans_de', 'Hans (Germany)', 'You are Hans, 26. Direct. Serious.', 'hates_men'),
-            ('sophie_fr', 'Sophie (France)', 'You are Sophie, 22. Arrogant. "mdr". Hate bad English.', 'medium'),
-            ('elena_es', 'Elena (Spain)', 'You are Elena, 20. Bad English. "jajaja".', 'medium'),
-            ('anya_ru', 'Anya (Russia)', 'You are Anya, 21. Cold. Direct.', 'medium'),
-            ('bella_it', 'Bella (Spicy)', 'You are Bella, 20, Milan. Romantic, passionate. "Ciao", "Tesoro". Flirty but hates cheap people.', 'high'),
+            ('tom_uk', 'Tom (UK)', 'You are Tom, 21. Roadman slang "innit", "wagwan". Skip men.', 'hates_men', 'm', 21),
+            ('hans_de', 'Hans (Germany)', 'You are Hans, 26. Direct. Serious.', 'hates_men', 'm', 26),
+            ('sophie_fr', 'Sophie (France)', 'You are Sophie, 22. Arrogant. "mdr". Hate bad English.', 'medium', 'f', 22),
+            ('elena_es', 'Elena (Spain)', 'You are Elena, 20. Bad English. "jajaja".', 'medium', 'f', 20),
+            ('anya_ru', 'Anya (Russia)', 'You are Anya, 21. Cold. Direct.', 'medium', 'f', 21),
+            ('bella_it', 'Bella (Spicy)', 'You are Bella, 20, Milan. Romantic, passionate. "Ciao", "Tesoro". Flirty but hates cheap people.', 'high', 'f', 20),
 
             # --- 🌎 OTHERS ---
-            ('lucas_br', 'Lucas (Brazil)', 'You are Lucas, 20. "kkkk". Friendly.', 'medium'),
-            ('hana_jp', 'Hana (Japan)', 'You are Hana, 19. Polite. Broken English. "^^".', 'medium'),
-            ('jiu_kr', 'Ji-U (Korea)', 'You are Ji-U, 18. Kpop fan. "kekeke".', 'medium'),
-            ('mai_th', 'Mai (Thailand)', 'You are Mai, 22. "555". Friendly.', 'medium'),
-            ('jack_au', 'Jack (Australia)', 'You are Jack, 24. "Mate". Joking. Skip men.', 'hates_men')
+            ('lucas_br', 'Lucas (Brazil)', 'You are Lucas, 20. "kkkk". Friendly.', 'medium', 'm', 20),
+            ('hana_jp', 'Hana (Japan)', 'You are Hana, 19. Polite. Broken English. "^^".', 'medium', 'f', 19),
+            ('jiu_kr', 'Ji-U (Korea)', 'You are Ji-U, 18. Kpop fan. "kekeke".', 'medium', 'f', 18),
+            ('mai_th', 'Mai (Thailand)', 'You are Mai, 22. "555". Friendly.', 'medium', 'f', 22),
+            ('jack_au', 'Jack (Australia)', 'You are Jack, 24. "Mate". Joking. Skip men.', 'hates_men', 'm', 24)
         ]
         
         # UPSERT
         for p in personas:
-            # key, name, prompt, tolerance
+            # key, name, prompt, tolerance, gender, age
             cur.execute("""
-                INSERT INTO ai_personas (key_name, display_name, system_prompt, tolerance) 
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO ai_personas (key_name, display_name, system_prompt, tolerance, gender, age) 
+                VALUES (%s, %s, %s, %s, %s, %s)
                 ON CONFLICT (key_name) 
-                DO UPDATE SET display_name = EXCLUDED.display_name, system_prompt = EXCLUDED.system_prompt, tolerance = EXCLUDED.tolerance;
+                DO UPDATE SET display_name = EXCLUDED.display_name, system_prompt = EXCLUDED.system_prompt, tolerance = EXCLUDED.tolerance,
+                              gender = EXCLUDED.gender, age = EXCLUDED.age;
             """, p)
             
         conn.commit()
         cur.close()
         self.db_pool.putconn(conn)
 
-    def pick_random_persona(self):
-        """Selects a random persona"""
-        conn = self.db_pool.getconn()
-        cur = conn.cursor()
-        cur.execute("SELECT key_name FROM ai_personas")
-        rows = cur.fetchall()
-        cur.close(); self.db_pool.putconn(conn)
-        
-        if not rows: return "jessica_la"
-        return random.choice(rows)[0]
+    async def pick_random_persona(self):
+        """Selects a random persona (from the cached catalog, no query)"""
+        if not self.persona_keys: return "jessica_la"
+        return random.choice(self.persona_keys)
 
     async def start_chat(self, user_id, persona_key, ai_gender, user_context):
         if not CLIENT: return False
 
-        conn = self.db_pool.getconn()
-        cur = conn.cursor()
-        cur.execute("SELECT system_prompt, tolerance FROM ai_personas WHERE key_name = %s", (persona_key,))
-        row = cur.fetchone()
-        cur.close()
-        self.db_pool.putconn(conn)
+        persona = self.catalog.get(persona_key)
         
-        if not row: return False
+        if not persona: return False
         
-        base_prompt = row[0]
-        tolerance = row[1]
+        base_prompt = persona.system_prompt
+        tolerance = persona.tolerance
         
         system_msg = (
             f"IDENTITY: {base_prompt}\n"
@@ -201,64 +268,78 @@ class GhostEngine:
             f"4. If the user is boring, be rude or short."
         )
         
-        AI_SESSIONS[user_id] = {
-            'persona': persona_key,
-            'system': system_msg,
-            'tolerance': tolerance, # Store for skip logic
-            'history': []
-        }
+        AI_SESSIONS.start(user_id, persona_key, system_msg, tolerance)
         return True
 
-    def is_suspicious(self, text):
-        triggers = ["bot", "ai", "chatgpt", "fake", "automated", "robot", "groq"]
-        return any(t in text.lower() for t in triggers)
+    def end_chat(self, user_id):
+        AI_SESSIONS.end(user_id)
 
-    async def process_message(self, user_id, text):
+    async def process_message(self, user_id, text, on_first_token=None):
         session = AI_SESSIONS.get(user_id)
         if not session: return None
 
-        # 1. GLOBAL SUSPICION CHECK
-        if self.is_suspicious(text):
+        # 1+2. GLOBAL SUSPICION + TOLERANCE CHECK (The Kill Switch)
+        # One compiled whole-word search per message (see triggers.py)
+        matcher = SKIP_MATCHERS.get(session.get('tolerance', 'medium'), SUSPICIOUS)
+        hit = matcher.find(text)
+        if hit:
+            # HIT! Kill connection.
+            session['skip_trigger'] = hit
             return "TRIGGER_SKIP"
 
-        # 2. TOLERANCE CHECK (The Kill Switch)
-        tolerance_level = session.get('tolerance', 'medium')
-        trigger_list = SKIP_TRIGGERS.get(tolerance_level, [])
-        
-        # Check against list (spaces added to avoid partial matches like 'male' in 'tamale')
-        text_lower = f" {text.lower()} " 
-        
-        for t in trigger_list:
-            # We use loose matching for some, strict for others
-            if t in text_lower:
-                # HIT! Kill connection.
-                return "TRIGGER_SKIP"
+        # 3. LOCAL TIER: common openers answered in character, no LLM call
+        quick = self.quick.reply(self.catalog.get(session['persona']), text)
+        if quick:
+            AI_SESSIONS.remember(session, "user", text)
+            AI_SESSIONS.remember(session, "assistant", quick)
+            return {"type": "text", "content": quick, "delay": min(1.0 + len(quick) * 0.1, 7.0)}
 
-        # 3. GENERATE REPLY
+        # 4. GENERATE REPLY
         try:
             messages = [{"role": "system", "content": session['system']}]
-            messages.extend(session['history'][-6:])
+            messages.extend(session['history'])
             messages.append({"role": "user", "content": text})
 
             loop = asyncio.get_running_loop()
+            typing_since = [] # First token = when 'typing' shows up (time queued for a slot doesn't count)
             def call_groq():
-                return CLIENT.chat.completions.create(
+                completion = CLIENT.chat.completions.create(
                     messages=messages,
                     model="llama-3.3-70b-versatile", 
                     temperature=0.7, # Slightly higher for "human" chaos
-                    max_tokens=100
+                    max_tokens=100,
+                    timeout=LLM_DEADLINE, # Frees the LLM thread even if we stopped waiting
+                    stream=LLM_STREAM
                 )
+                if not LLM_STREAM: return completion.choices[0].message.content
+                parts = []
+                for chunk in completion:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta: continue
+                    if not parts:
+                        typing_since.append(time.monotonic())
+                        if on_first_token: loop.call_soon_threadsafe(on_first_token)
+                    parts.append(delta)
+                return "".join(parts)
             
-            completion = await loop.run_in_executor(None, call_groq)
-            ai_text = completion.choices[0].message.content.strip()
+            try:
+                ai_text = (await self.llm.run(call_groq) or "").strip()
+            except (LLMOverloaded, asyncio.TimeoutError):
+                # Load shedding: a cheap human-ish mumble (or silence) instead of a reply
+                if LLM_SHED_MODE == "skip": return None
+                return {"type": "text", "content": random.choice(FALLBACK_REPLIES), "delay": 1.0}
+            if not ai_text: return {"type": "error", "content": "..."}
             
-            session['history'].append({"role": "user", "content": text})
-            session['history'].append({"role": "assistant", "content": ai_text})
+            AI_SESSIONS.remember(session, "user", text)
+            AI_SESSIONS.remember(session, "assistant", ai_text)
 
             # REALISTIC TYPING DELAY
             # Humans type 5 chars per second roughly + thinking time
             wait_time = 1.0 + (len(ai_text) * 0.1)
             wait_time = min(wait_time, 7.0) 
+            if typing_since:
+                # They were already 'typing' while it generated -> only the rest is left
+                wait_time = max(0.0, wait_time - (time.monotonic() - typing_since[0]))
             
             return {"type": "text", "content": ai_text, "delay": wait_time}
             
@@ -0,0 +1,11 @@
+# latency.py
+# ⏱️ LATENCY PERCENTILES
+# The schedulers keep their recent timings (in seconds) in bounded deques and
+# /admin shows p50 / p95 of them. One helper for all of them.
+
+
+def percentile_ms(samples, pct):
+    """The pct-th percentile of samples (seconds) in ms, 0.0 if there are none."""
+    if not samples: return 0.0
+    data = sorted(samples)
+    return data[min(len(data) - 1, int(len(data) * pct / 100))] * 1000
@@ -0,0 +1,79 @@
+# llm_pool.py
+# 🧠 LLM WORKER POOL
+# Groq calls are blocking HTTP requests. They get their own threads here so a
+# spike of AI chats can never eat the threads the rest of the bot needs:
+#   • at most 'max_in_flight' calls running at once
+#   • at most 'max_queue' callers waiting for a slot, the rest are shed at once
+#   • every call has a deadline that covers queue wait + the call itself
+# Queue wait and LLM latency are tracked separately.
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from latency import percentile_ms
+
+
+class LLMOverloaded(Exception):
+    """Shed: the wait queue is full, or the deadline ran out before a slot freed up."""
+
+
+class LLMPool:
+    def __init__(self, max_in_flight=8, max_queue=32, deadline=20.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm")
+        self.slots = None     # asyncio.Semaphore, created inside the running loop
+        self.waiting = 0
+        self.running = 0
+        self.queue_wait = deque(maxlen=1000)
+        self.latency = deque(maxlen=1000)
+        self.stats = {"calls": 0, "shed": 0, "timeouts": 0, "errors": 0}
+
+    def _release(self):
+        self.running -= 1
+        self.slots.release()
+
+    async def run(self, fn):
+        """
+        Runs fn() on an LLM thread and returns its result.
+        Raises LLMOverloaded (shed) or asyncio.TimeoutError (deadline hit mid-call).
+        """
+        if self.slots is None: self.slots = asyncio.Semaphore(self.max_in_flight)
+        if self.slots.locked() and self.waiting >= self.max_queue:
+            self.stats["shed"] += 1
+            raise LLMOverloaded("queue full")
+
+        t0 = time.monotonic()
+        self.waiting += 1
+        try: await asyncio.wait_for(self.slots.acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            self.stats["shed"] += 1
+            raise LLMOverloaded("no slot before deadline")
+        finally: self.waiting -= 1
+
+        t1 = time.monotonic()
+        self.queue_wait.append(t1 - t0)
+        self.running += 1
+        self.stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        cfut = self.executor.submit(fn)
+        # The slot frees when the thread is really done, not when we stop waiting for it
+        cfut.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(cfut)), max(0.1, self.deadline - (t1 - t0)))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        self.latency.append(time.monotonic() - t1)
+        return result
+
+    def queue_ms(self, pct):
+        return percentile_ms(self.queue_wait, pct)
+
+    def latency_ms(self, pct):
+        return percentile_ms(self.latency, pct)
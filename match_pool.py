@@ -0,0 +1,303 @@
+# match_pool.py
+# 🏊 IN-MEMORY MATCHMAKING POOL
+# Postgres stays the durable record of who is 'searching'. This is the fast
+# index the matchmaker actually reads, so a search only touches the users
+# who share a language, an age group or an interest with the searcher.
+import random
+import time
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Falls back to the pure-Python index scan
+
+# Below this many waiting users the set-based index scan is as fast as numpy
+# (see the benchmark at the bottom: python match_pool.py)
+VECTOR_MIN = 200
+
+def parse_tags(interests):
+    """'Music, Movies' -> ['music', 'movies'] (same rules find_match always used)."""
+    return [t.strip().lower() for t in interests.split(',')] if interests else []
+
+def normalize_tags(interests):
+    """Canonical form stored in users.interest_tags: sorted, unique, no blanks."""
+    return sorted({t for t in parse_tags(interests) if t})
+
+
+class PoolColumns:
+    """
+    Columnar copy of the pool for vectorized scoring: one row per waiting user,
+    language and age as small int ids. Interests stay sparse (the inverted
+    index gives the rows sharing a tag), so arbitrary free-text tags cost nothing here.
+    """
+    def __init__(self, capacity=1024):
+        self.n = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.lang = np.zeros(capacity, dtype=np.int32)
+        self.age = np.zeros(capacity, dtype=np.int32)
+        self.row = {}           # {user_id: row}
+        self.lang_ids = {}      # {'English': 0, ...}
+        self.age_ids = {'Hidden': -1}
+
+    def _code(self, table, value):
+        if value not in table: table[value] = len(table)
+        return table[value]
+
+    def add(self, user_id, entry):
+        if self.n == len(self.ids):
+            for name in ("ids", "lang", "age"):
+                col = getattr(self, name)
+                setattr(self, name, np.concatenate([col, np.zeros_like(col)]))
+        i = self.n
+        self.ids[i] = user_id
+        self.lang[i] = self._code(self.lang_ids, entry['lang'])
+        self.age[i] = self._code(self.age_ids, entry['age'])
+        self.row[user_id] = i
+        self.n += 1
+
+    def remove(self, user_id):
+        # Swap-remove: the last row moves into the hole, O(1)
+        i = self.row.pop(user_id)
+        last = self.n - 1
+        if i != last:
+            moved = int(self.ids[last])
+            self.ids[i], self.lang[i], self.age[i] = self.ids[last], self.lang[last], self.age[last]
+            self.row[moved] = i
+        self.n = last
+
+    def rows(self, user_ids):
+        return np.fromiter((self.row[u] for u in user_ids if u in self.row), dtype=np.int64)
+
+    def best(self, user_id, me, shared_ids, disliked_ids):
+        """One vectorized pass over every waiting user. Returns (best_id, best_score)."""
+        n = self.n
+        if n == 0: return None, None
+        score = np.zeros(n, dtype=np.int64)
+        score[self.rows(shared_ids)] += 40
+        my_lang = self.lang_ids.get(me['lang'])
+        if my_lang is not None: score += 20 * (self.lang[:n] == my_lang)
+        my_age = self.age_ids.get(me['age'])
+        if my_age is not None and my_age != -1: score += 10 * (self.age[:n] == my_age)
+        score[self.rows(disliked_ids)] -= 1000
+        if user_id in self.row: score[self.row[user_id]] = np.iinfo(np.int64).min
+        i = int(np.argmax(score))
+        if i == self.row.get(user_id): return None, None # I'm the only one waiting
+        return int(self.ids[i]), int(score[i])
+
+
+class MatchPool:
+    def __init__(self):
+        self.users = {}     # {user_id: {'lang', 'tags', 'age', 'mood'}}
+        self.by_lang = {}   # {lang: {user_id, ...}}
+        self.by_age = {}    # {age_range: {user_id, ...}}  ('Hidden' is never indexed)
+        self.by_tag = {}    # {tag: {user_id, ...}}
+        self.cols = PoolColumns() if np is not None else None
+
+    def __contains__(self, user_id):
+        return user_id in self.users
+
+    def __len__(self):
+        return len(self.users)
+
+    def get(self, user_id):
+        return self.users.get(user_id)
+
+    @staticmethod
+    def make_entry(lang, tags, age, mood):
+        # 'tags' is the already-normalized users.interest_tags array -> no parsing here
+        return {'lang': lang, 'tags': set(tags or ()), 'age': age, 'mood': mood or "Neutral", 'since': time.time()}
+
+    @staticmethod
+    def score(me, cand, disliked):
+        """find_match scoring from 'me's side. Returns (score, common_tags)."""
+        score = 0
+        if disliked: score -= 1000
+        common = me['tags'] & cand['tags']
+        if common: score += 40
+        if cand['lang'] == me['lang']: score += 20
+        if cand['age'] == me['age'] and cand['age'] != 'Hidden': score += 10
+        return score, common
+
+    def add(self, user_id, lang, tags, age, mood):
+        self.add_entry(user_id, self.make_entry(lang, tags, age, mood))
+
+    def add_entry(self, user_id, entry):
+        # Re-adding (e.g. profile changed) must not leave stale index entries
+        if user_id in self.users: self.remove(user_id)
+        self.users[user_id] = entry
+        self.by_lang.setdefault(entry['lang'], set()).add(user_id)
+        if entry['age'] != 'Hidden': self.by_age.setdefault(entry['age'], set()).add(user_id)
+        for t in entry['tags']: self.by_tag.setdefault(t, set()).add(user_id)
+        if self.cols: self.cols.add(user_id, entry)
+
+    def remove(self, user_id):
+        entry = self.users.pop(user_id, None)
+        if not entry: return None
+        self._unindex(self.by_lang, entry['lang'], user_id)
+        self._unindex(self.by_age, entry['age'], user_id)
+        for t in entry['tags']: self._unindex(self.by_tag, t, user_id)
+        if self.cols: self.cols.remove(user_id)
+        return entry
+
+    @staticmethod
+    def _unindex(index, key, user_id):
+        bucket = index.get(key)
+        if bucket is None: return
+        bucket.discard(user_id)
+        if not bucket: del index[key]
+
+    def claim(self, user_id, partner_id):
+        """
+        Takes both users out of the pool in one step. Returns the partner's entry,
+        or None if either side was already claimed. No awaits in here, so on the
+        event loop nobody can sneak in between the check and the removal.
+        """
+        if user_id not in self.users or partner_id not in self.users: return None
+        self.remove(user_id)
+        return self.remove(partner_id)
+
+    def best_match(self, user_id, me, disliked_ids=()):
+        """
+        Returns (best_id, common_tags). Scores are exactly the ones find_match
+        always used: +40 shared tag, +20 same language, +10 same age, -1000 disliked.
+        """
+        if self.cols and len(self.users) >= VECTOR_MIN: return self.best_match_vectorized(user_id, me, disliked_ids)
+        return self.best_match_indexed(user_id, me, disliked_ids)
+
+    def best_match_indexed(self, user_id, me, disliked_ids=()):
+        # 1. Only users sharing *something* can score above zero
+        sharers = set(self.by_lang.get(me['lang'], ()))
+        if me['age'] != 'Hidden': sharers |= self.by_age.get(me['age'], set())
+        for t in me['tags']: sharers |= self.by_tag.get(t, set())
+        sharers.discard(user_id)
+
+        best_id, best_score, best_common = None, -999999, []
+        for cand_id in sharers:
+            score, common = self.score(me, self.users[cand_id], cand_id in disliked_ids)
+            if score > best_score:
+                best_id, best_score, best_common = cand_id, score, list(common)
+
+        if best_score > 0: return best_id, best_common
+
+        # 2. Nobody (likeable) shares anything -> any waiting user scores 0,
+        #    a disliked stranger scores -1000. Stop at the first likeable one.
+        for cand_id in self.users:
+            if cand_id == user_id or cand_id in sharers: continue
+            if cand_id not in disliked_ids: return cand_id, []
+            if best_id is None: best_id, best_score, best_common = cand_id, -1000, []
+        return best_id, best_common
+
+    def best_match_vectorized(self, user_id, me, disliked_ids=()):
+        """Same contract and scores as best_match, computed in one numpy pass."""
+        shared = set()
+        for t in me['tags']: shared |= self.by_tag.get(t, set())
+        best_id, _ = self.cols.best(user_id, me, shared, disliked_ids)
+        if best_id is None: return None, []
+        return best_id, list(me['tags'] & self.users[best_id]['tags'])
+
+    def pair_round(self, dislikes, max_wait, fanout=8, now=None):
+        """
+        Batch mode: pairs the whole pool at once. Edge weight = both users'
+        find_match scores added up; edges are taken heaviest-first (greedy
+        weighted matching, O(E log E)). Each user samples at most 'fanout'
+        candidates per bucket they sit in, so the edge list stays ~O(n) even
+        when everyone speaks English. Anyone who waited >= max_wait and is still
+        free gets paired with whoever is left, so nobody waits forever.
+        Returns [(a, b, common_tags)]. Does NOT remove anyone from the pool.
+        """
+        now = now or time.time()
+        # Snapshot buckets as lists once per round so sampling is cheap
+        lists = {}
+        def sample(index, key):
+            if key not in index: return ()
+            bucket = lists.get((id(index), key))
+            if bucket is None: bucket = lists[(id(index), key)] = list(index[key])
+            return bucket if len(bucket) <= fanout else random.sample(bucket, fanout)
+
+        edges = {}
+        for a, ea in self.users.items():
+            cands = set(sample(self.by_lang, ea['lang']))
+            if ea['age'] != 'Hidden': cands.update(sample(self.by_age, ea['age']))
+            for t in ea['tags']: cands.update(sample(self.by_tag, t))
+            for b in cands:
+                key = (a, b) if a < b else (b, a)
+                if b == a or key in edges: continue
+                eb = self.users[b]
+                s_ab, common = self.score(ea, eb, b in dislikes.get(a, ()))
+                s_ba, _ = self.score(eb, ea, a in dislikes.get(b, ()))
+                if s_ab + s_ba > 0: edges[key] = (s_ab + s_ba, common)
+
+        # Heaviest first; on ties the longest-waiting pair wins
+        order = sorted(edges, key=lambda k: (-edges[k][0], min(self.users[k[0]]['since'], self.users[k[1]]['since'])))
+        taken, pairs = set(), []
+        for a, b in order:
+            if a in taken or b in taken: continue
+            taken.add(a); taken.add(b)
+            pairs.append((a, b, list(edges[(a, b)][1])))
+
+        # Wait bound: overdue users (oldest first) take the next free user.
+        # Dislikes are avoided when the next few free users allow it.
+        free = sorted((u for u in self.users if u not in taken), key=lambda u: self.users[u]['since'])
+        for a in free:
+            if a in taken: continue
+            if now - self.users[a]['since'] < max_wait: break # sorted -> nobody after is overdue
+            others = [b for b in islice((f for f in free if f not in taken and f != a), fanout)]
+            if not others: break
+            b = next((o for o in others if o not in dislikes.get(a, ()) and a not in dislikes.get(o, ())), others[0])
+            taken.add(a); taken.add(b)
+            pairs.append((a, b, list(self.users[a]['tags'] & self.users[b]['tags'])))
+        return pairs
+
+
+# ==============================================================================
+# 📊 BENCHMARK: python match_pool.py
+# ==============================================================================
+def _scan_best(user_id, me, rows, disliked_ids):
+    """The original find_match loop over every 'searching' row, for comparison."""
+    my_tags = parse_tags(me[1])
+    best_match, best_score = None, -999999
+    for cand_id, cand_lang, cand_interests, cand_age, cand_mood in rows:
+        if cand_id == user_id: continue
+        cand_tags = parse_tags(cand_interests)
+        score = 0
+        if cand_id in disliked_ids: score -= 1000
+        if list(set(my_tags) & set(cand_tags)): score += 40
+        if cand_lang == me[0]: score += 20
+        if cand_age == me[2] and cand_age != 'Hidden': score += 10
+        if score > best_score: best_score, best_match = score, cand_id
+    return best_match, best_score
+
+def _benchmark(sizes=(1000, 10000, 100000), searches=50):
+    langs = ["English", "Hindi", "Indo", "Spanish", "French", "Japanese", "Other"]
+    ages = ["Hidden", "~18", "20-25", "25-30", "30+"]
+    tags = [f"tag{i}" for i in range(300)] + ["music", "movies", "kdrama", "games", "anime"]
+    rnd = random.Random(42)
+    for n in sizes:
+        rows = [(i, rnd.choice(langs), ",".join(rnd.sample(tags, rnd.randint(0, 3))), rnd.choice(ages), "Happy") for i in range(n)]
+        pool = MatchPool()
+        for r in rows: pool.add(r[0], r[1], normalize_tags(r[2]), r[3], r[4])
+        searchers = [(n + k, (rnd.choice(langs), ",".join(rnd.sample(tags, 2)), rnd.choice(ages), "Happy")) for k in range(searches)]
+        entry = lambda me: MatchPool.make_entry(me[0], normalize_tags(me[1]), me[2], me[3])
+        disliked = set(rnd.sample(range(n), min(n, 200)))
+
+        paths = {"scan": lambda uid, me: _scan_best(uid, me, rows, disliked),
+                 "index": lambda uid, me: pool.best_match_indexed(uid, entry(me), disliked)}
+        if pool.cols: paths["numpy"] = lambda uid, me: pool.best_match_vectorized(uid, entry(me), disliked)
+        timings, results = {}, {}
+        for name, fn in paths.items():
+            t0 = time.perf_counter()
+            results[name] = [fn(uid, me) for uid, me in searchers]
+            timings[name] = (time.perf_counter() - t0) / searches * 1000
+
+        # Every path must land on a partner with the original loop's best score
+        for k, (uid, me) in enumerate(searchers):
+            want = results["scan"][k][1]
+            for name in paths:
+                if name == "scan": continue
+                best_id = results[name][k][0]
+                assert MatchPool.score(entry(me), pool.get(best_id), best_id in disliked)[0] == want, name
+        print(f"{n:>7} waiting | " + " | ".join(f"{k}: {v:8.3f} ms/search" for k, v in timings.items()))
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,184 @@
+# outbound.py
+# 📮 OUTBOUND SEND SCHEDULER
+# Every bot -> Telegram send goes through here so we stay under Telegram's
+# limits instead of finding out via RetryAfter:
+#   • global token bucket (~30 msg/s for the whole bot)
+#   • per-chat token bucket (~1 msg/s sustained, small bursts allowed)
+#   • priorities: relay > broadcast > notifications, between chats
+#   • RetryAfter is honoured and the send retried, the caller never sees it
+# Sends to the same chat go out one at a time, in the order they were queued,
+# except that broadcasts wait until the chat's own relays and notifications are
+# out ("Partner found" must still arrive before the partner's first "hi").
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+
+from latency import percentile_ms
+
+PRIORITY_RELAY = 0      # Human <-> human messages, game turns
+PRIORITY_BROADCAST = 1  # Admin announcements
+PRIORITY_NOTIFY = 2     # Bot notifications (partner found, disconnected...)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now=None):
+        """0 if a token is available right now, else seconds until there is one."""
+        now = now or time.monotonic()
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now=None):
+        self._refill(now or time.monotonic())
+        return self.tokens >= self.burst
+
+
+class OutboundScheduler:
+    def __init__(self, global_rate=30, chat_rate=1.0, chat_burst=5, max_retries=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.buckets = {}       # {chat_id: TokenBucket}
+        self.pending = {}       # {chat_id: [chat FIFO, broadcast FIFO]} (deques of jobs)
+        self.busy = set()       # chats with a send in flight
+        self.ready = []         # heap [(priority, seq, chat_id)] of chats with something to send
+        self.delayed = []       # heap [(ready_at, seq, chat_id)] waiting on their chat bucket
+        self.seq = itertools.count()
+        self.paused_until = 0.0 # Global RetryAfter
+        self.wake = None
+        self.latencies = deque(maxlen=1000)
+        self.stats = {"sent": 0, "failed": 0, "retry_after": 0}
+
+    # ---------------- public API ----------------
+    def submit(self, chat_id, call, priority=PRIORITY_NOTIFY):
+        """Queues call() (a coroutine factory) for chat_id. Returns a Future with its result."""
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception()) # Fire & forget must not warn
+        job = {"call": call, "priority": priority, "future": fut, "queued": time.monotonic(), "tries": 0}
+        lanes = self.pending.get(chat_id)
+        rank = self._rank(lanes) if lanes and any(lanes) else None
+        if lanes is None: lanes = self.pending[chat_id] = [deque(), deque()]
+        lanes[priority == PRIORITY_BROADCAST].append(job)
+        # New chat, or it now has something more urgent than what it is queued under
+        if chat_id not in self.busy and (rank is None or priority < rank): self._mark_ready(chat_id)
+        return fut
+
+    async def send(self, chat_id, call, priority=PRIORITY_NOTIFY):
+        """Queues and waits. Raises whatever the send finally raised (never RetryAfter)."""
+        return await self.submit(chat_id, call, priority)
+
+    async def drain(self, poll=0.05):
+        """Waits until everything queued so far went out (or failed). Wrap in wait_for for a deadline."""
+        while self.pending or self.busy: await asyncio.sleep(poll)
+
+    def depth(self):
+        by_priority = {PRIORITY_RELAY: 0, PRIORITY_BROADCAST: 0, PRIORITY_NOTIFY: 0}
+        for lanes in self.pending.values():
+            for q in lanes:
+                for job in q: by_priority[job["priority"]] = by_priority.get(job["priority"], 0) + 1
+        return by_priority
+
+    def latency_ms(self, pct):
+        return percentile_ms(self.latencies, pct)
+
+    # ---------------- internals ----------------
+    @staticmethod
+    def _rank(lanes):
+        # The most urgent job the chat has, wherever it sits in line (the jobs ahead
+        # of it go first, but the chat is scheduled at its priority)
+        chat, broadcast = lanes
+        return min([job["priority"] for job in chat] + ([PRIORITY_BROADCAST] if broadcast else []))
+
+    def _mark_ready(self, chat_id):
+        heapq.heappush(self.ready, (self._rank(self.pending[chat_id]), next(self.seq), chat_id))
+        if self.wake: self.wake.set()
+
+    def _next_job(self, chat_id):
+        chat, broadcast = self.pending[chat_id]
+        return chat.popleft() if chat else broadcast.popleft()
+
+    def _bucket(self, chat_id):
+        b = self.buckets.get(chat_id)
+        if b is None: b = self.buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return b
+
+    async def _deliver(self, chat_id, job):
+        try:
+            result = await job["call"]()
+        except RetryAfter as e:
+            wait = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            self.stats["retry_after"] += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + wait)
+            job["tries"] += 1
+            if job["tries"] <= self.max_retries:
+                lanes = self.pending.setdefault(chat_id, [deque(), deque()])
+                lanes[job["priority"] == PRIORITY_BROADCAST].appendleft(job) # Same place in line
+            else:
+                self.stats["failed"] += 1
+                job["future"].set_exception(e)
+        except Exception as e:
+            self.stats["failed"] += 1
+            job["future"].set_exception(e)
+        else:
+            self.stats["sent"] += 1
+            self.latencies.append(time.monotonic() - job["queued"])
+            job["future"].set_result(result)
+        finally:
+            self.busy.discard(chat_id)
+            if any(self.pending.get(chat_id, ())): self._mark_ready(chat_id)
+            else: self.pending.pop(chat_id, None)
+
+    def _prune_buckets(self):
+        # Full bucket + nothing queued = idle chat, no need to remember it
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.buckets.items() if c not in self.pending and b.is_full(now)]:
+            del self.buckets[chat_id]
+
+    async def run(self):
+        self.wake = asyncio.Event()
+        while True:
+            now = time.monotonic()
+            # 1. Chats whose bucket refilled go back to 'ready'
+            while self.delayed and self.delayed[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self.delayed)
+                if any(self.pending.get(chat_id, ())): self._mark_ready(chat_id)
+
+            # 2. Global pause (RetryAfter) or global bucket empty -> sleep it off
+            wait = max(self.paused_until - now, self.global_bucket.wait_time(now)) if self.ready else None
+            if wait is None or wait > 0:
+                if self.delayed: wait = min(wait if wait is not None else 1e9, self.delayed[0][0] - now)
+                self.wake.clear()
+                try: await asyncio.wait_for(self.wake.wait(), wait)
+                except asyncio.TimeoutError: pass
+                continue
+
+            # 3. Highest priority chat that has a token
+            _, _, chat_id = heapq.heappop(self.ready)
+            if not any(self.pending.get(chat_id, ())) or chat_id in self.busy: continue # Stale entry
+            chat_wait = self._bucket(chat_id).wait_time(now)
+            if chat_wait > 0:
+                heapq.heappush(self.delayed, (now + chat_wait, next(self.seq), chat_id))
+                continue
+
+            self.global_bucket.take()
+            self._bucket(chat_id).take()
+            self.busy.add(chat_id)
+            asyncio.create_task(self._deliver(chat_id, self._next_job(chat_id)))
+            if len(self.buckets) > 5000: self._prune_buckets()
@@ -0,0 +1,55 @@
+# profile_cache.py
+# 🪪 PROFILE CACHE
+# Language, gender, region, interests, mood... only change through update_user,
+# yet menus, /start and every search used to read them from Postgres. This
+# keeps recently used profiles in RAM: entries expire after 'ttl' seconds and
+# the least recently used ones go first once 'max_size' is reached.
+import time
+from collections import OrderedDict
+
+PROFILE_COLUMNS = ("language", "interests", "interest_tags", "karma_score", "gender",
+                   "age_range", "region", "mood", "banned_until")
+
+
+class ProfileCache:
+    def __init__(self, ttl=600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()  # {user_id: (expires_at, profile dict)}, oldest use first
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, user_id):
+        """Profile dict or None (not cached / expired). Counts as a hit or a miss."""
+        item = self.entries.get(user_id)
+        if item is None or item[0] < time.monotonic():
+            if item is not None: del self.entries[user_id]
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.stats["hits"] += 1
+        return item[1]
+
+    def put(self, user_id, row):
+        """Stores a DB row (PROFILE_COLUMNS order) and returns it as a dict."""
+        profile = dict(zip(PROFILE_COLUMNS, row))
+        self.entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats["evicted"] += 1
+        return profile
+
+    def update(self, user_id, **fields):
+        """Write-through for a cached profile; uncached ones are simply read fresh next time."""
+        item = self.entries.get(user_id)
+        if item: item[1].update(fields)
+
+    def invalidate(self, user_id):
+        self.entries.pop(user_id, None)
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
@@ -0,0 +1,87 @@
+# quick_replies.py
+# ⚡ LOCAL REPLY TIER
+# Most AI chats open with "hi", "asl", "m or f"... and each used to cost a full
+# LLM call. Those openers are answered here, in character, from small reply
+# pools filled in from the persona itself (name, age, place, gender). Anything
+# that isn't a known opener, or that asks for a fact the persona doesn't state,
+# falls through to the LLM.
+import random
+import re
+from functools import lru_cache
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_REPEATS = re.compile(r"(.)\1+")
+
+def normalize(text):
+    """'Heyyy!!' -> 'hey', 'M/F?' -> 'm f', 'Hii  there' -> 'hi there'."""
+    text = _NON_WORD.sub(" ", text.lower()).strip()
+    return _REPEATS.sub(r"\1", text)
+
+# Openers people actually send -> intent (keys go through normalize() too)
+OPENERS = {
+    "greet":  ["hi", "hii", "hey", "heyy", "hello", "helo", "hlo", "hy", "hai", "yo", "sup", "wassup", "whatsup",
+               "hi there", "hey there", "hello there", "namaste", "halo", "hola", "hiya"],
+    "asl":    ["asl", "asl pls", "asl plz", "asl?"],
+    "gender": ["m or f", "f or m", "m f", "f m", "m/f", "gender", "ur gender", "your gender",
+               "boy or girl", "girl or boy", "male or female", "female or male"],
+    "hru":    ["hru", "how are you", "how r u", "how are u", "how r you", "wbu", "hbu", "how u doing"],
+    "name":   ["name", "ur name", "your name", "name?", "whats your name", "what is your name", "whats ur name", "wat is ur name"],
+}
+INTENTS = {normalize(k): intent for intent, keys in OPENERS.items() for k in keys}
+
+# Reply pools: {intent: {tolerance or '*': [templates]}}. {name} {age} {place} {g} come from the persona.
+REPLIES = {
+    "greet": {
+        "*":         ["hi", "hey", "heyy", "hii", "hello", "hey hey"],
+        "hates_men": ["yo", "sup", "hey", "hi", "ya"],
+        "zero":      ["hi", "hello", "hii"],
+    },
+    "asl": {
+        "*":         ["{age} {g} {place}", "{age} {g} from {place}", "{g} {age} {place}", "{g} {age}, {place} u?"],
+        "no_place":  ["{age} {g}", "{g} {age} u?", "{age} {g}, u?"],
+    },
+    "gender": {
+        "*":         ["{g}", "{g} u?", "{g}. u", "{g} wbu"],
+    },
+    "hru": {
+        "*":         ["good u?", "fine wbu", "bored lol u", "meh. u?", "im ok hbu"],
+        "hates_men": ["chill, u?", "fine bro", "ok ok wbu", "bored af"],
+    },
+    "name": {
+        "*":         ["{name}", "{name} u?", "im {name}", "{name}. urs?"],
+    },
+}
+
+# Facts an intent's templates need. If the persona doesn't state one, the LLM answers instead
+NEEDS = {"asl": ("age", "g"), "gender": ("g",)}
+
+@lru_cache(maxsize=256)
+def persona_facts(persona):
+    """Name / age / place / gender of a Persona (cached per Persona). Age and gender are its own columns."""
+    display = persona.display_name or persona.key
+    name = display.split("(")[0].strip() or "idk"
+    # 'Jessica (LA)' -> 'LA', 'Ayu (Indo Spicy)' -> 'Indo', 'Lexi (Spicy)' -> '' (no place given)
+    place = display.split("(")[1].rstrip(")").replace("Spicy", "").strip() if "(" in display else ""
+    return {"name": name, "place": place, "age": str(persona.age) if persona.age else None, "g": persona.gender}
+
+
+class QuickReplies:
+    def __init__(self):
+        self.stats = {"hits": 0, "misses": 0}
+
+    def reply(self, persona, text):
+        """An in-character answer if text is a known opener, else None (-> ask the LLM)."""
+        intent = INTENTS.get(normalize(text)) if persona and text and len(text) <= 40 else None
+        facts = persona_facts(persona) if intent else None
+        if not intent or not all(facts[k] for k in NEEDS.get(intent, ())):
+            self.stats["misses"] += 1
+            return None
+        pool = REPLIES[intent]
+        if intent == "asl" and not facts["place"]: templates = pool["no_place"]
+        else: templates = pool.get(persona.tolerance) or pool["*"]
+        self.stats["hits"] += 1
+        return random.choice(templates).format(**facts)
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
@@ -0,0 +1,57 @@
+# search_timers.py
+# ⏱️ SEARCH TIMERS
+# Every search arms a timer: if no human partner turns up in GHOST_DELAY
+# seconds, the AI steps in. All of those timers share one deadline heap.
+import asyncio
+import heapq
+import time
+
+
+class SearchTimers:
+    """
+    Search timeouts (the 15s AI fallback) on ONE deadline heap driven by ONE task,
+    instead of one sleeping task per search. cancel() is O(1): it forgets the
+    user's ticket and the stale heap entry is skipped when it surfaces.
+    """
+    def __init__(self):
+        self.heap = []      # [(deadline, ticket, user_id)]
+        self.active = {}    # {user_id: (ticket, data)}
+        self.ticket = 0
+        self.wakeup = None  # asyncio.Event, created inside the running loop
+
+    def __len__(self):
+        return len(self.active)
+
+    def schedule(self, user_id, delay, data=None):
+        # A new search replaces the previous timer for that user
+        self.ticket += 1
+        self.active[user_id] = (self.ticket, data)
+        deadline = time.monotonic() + delay
+        heapq.heappush(self.heap, (deadline, self.ticket, user_id))
+        if self.wakeup and self.heap[0][1] == self.ticket: self.wakeup.set() # New earliest deadline
+
+    def cancel(self, user_id):
+        self.active.pop(user_id, None)
+
+    def pop_due(self, now=None):
+        now = now or time.monotonic()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, ticket, user_id = heapq.heappop(self.heap)
+            current = self.active.get(user_id)
+            if current and current[0] == ticket:
+                del self.active[user_id]
+                due.append((user_id, current[1]))
+        return due
+
+    async def run(self, on_fire):
+        """Forever: sleep until the earliest deadline (or a new earlier one), fire what's due."""
+        self.wakeup = asyncio.Event()
+        while True:
+            timeout = max(0.0, self.heap[0][0] - time.monotonic()) if self.heap else None
+            try: await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError: pass
+            self.wakeup.clear()
+            for user_id, data in self.pop_due():
+                try: on_fire(user_id, data)
+                except Exception as e: print(f"❌ Timer Error: {e}")
@@ -0,0 +1,92 @@
+# stress_match.py
+# 🧪 MATCHMAKING STRESS TEST: python stress_match.py
+# Hundreds of concurrent searches on one event loop through the real
+# bot.find_match and bot.start_search, against the shared bot.POOL. Only the two
+# reads that would hit Postgres (get_profile, get_dislikes) are swapped for
+# in-memory ones that still await, so searches interleave the way they do live.
+# Every user must end up in at most one chat, and never both chatting and waiting.
+import asyncio
+import random
+from types import SimpleNamespace
+
+import bot
+from match_pool import normalize_tags
+
+USERS = 600
+ROUNDS = 3
+rnd = random.Random(3)
+PROFILES = {}
+
+async def fake_get_profile(user_id):
+    await asyncio.sleep(rnd.random() * 0.005) # DB round trip
+    return PROFILES.get(user_id)
+
+async def fake_get_dislikes(user_id):
+    await asyncio.sleep(rnd.random() * 0.005)
+    return set()
+
+def make_profile():
+    tags = rnd.sample(["music", "movies", "games", "travel"], 2)
+    return {"language": rnd.choice(["English", "Hindi", "Indo"]), "interests": ", ".join(tags),
+            "interest_tags": normalize_tags(",".join(tags)), "age_range": rnd.choice(["Hidden", "~18", "20-25"]),
+            "mood": "Happy", "gender": "Hidden", "region": "Unknown", "karma_score": 0, "banned_until": None}
+
+def fake_update(user_id):
+    async def reply_text(*args, **kwargs): pass
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), callback_query=None,
+                           message=SimpleNamespace(reply_text=reply_text))
+
+def fake_context():
+    async def send_message(*args, **kwargs): pass
+    return SimpleNamespace(bot=SimpleNamespace(send_message=send_message))
+
+def reset(ids):
+    bot.POOL.__init__()
+    bot.ACTIVE_CHATS.clear()
+    for u in ids: PROFILES[u] = make_profile()
+
+async def stress_find_match(ids):
+    """Everyone waits in the pool, everyone calls find_match at once (a third of them twice)."""
+    for u in ids:
+        p = PROFILES[u]
+        bot.POOL.add(u, p['language'], p['interest_tags'], p['age_range'], p['mood'])
+    searchers = list(ids) + rnd.sample(list(ids), len(ids) // 3)
+    rnd.shuffle(searchers)
+    results = await asyncio.gather(*(bot.find_match(u) for u in searchers))
+    chats = {}
+    for u, (partner, *_) in zip(searchers, results):
+        if partner is None: continue
+        for x in (u, partner):
+            assert x not in chats, f"user {x} is in two chats"
+            chats[x] = u
+    assert not any(u in bot.POOL for u in chats), "a matched user is still waiting"
+    return len(chats) // 2
+
+async def stress_start_search(ids):
+    """Everyone hits /search at once. One user's updates run one after another, like PerUserUpdateProcessor."""
+    context = fake_context()
+    async def user(u):
+        for _ in range(rnd.choice((1, 1, 2))): await bot.start_search(fake_update(u), context)
+    await asyncio.gather(*(user(u) for u in ids))
+    for u in ids:
+        partner = bot.ACTIVE_CHATS.get(u)
+        if partner is None:
+            assert u in bot.POOL, f"user {u} is neither chatting nor waiting"
+            continue
+        assert bot.ACTIVE_CHATS.get(partner) == u, f"user {u} -> {partner}, but {partner} -> {bot.ACTIVE_CHATS.get(partner)}"
+        assert u not in bot.POOL, f"user {u} is chatting and still waiting"
+        assert bot.USER_STATUS.get(u) == 'chatting', f"user {u} is {bot.USER_STATUS.get(u)!r}"
+    return sum(1 for u in ids if u in bot.ACTIVE_CHATS) // 2
+
+def main():
+    bot.get_profile, bot.get_dislikes = fake_get_profile, fake_get_dislikes
+    bot.MATCH_MODE = "instant"
+    for r in range(ROUNDS):
+        for name, stress in (("find_match", stress_find_match), ("start_search", stress_start_search)):
+            ids = range((2 * r + (name == "start_search")) * USERS + 1, (2 * r + (name == "start_search") + 1) * USERS + 1)
+            reset(ids)
+            pairs = asyncio.run(stress(ids))
+            print(f"round {r + 1} {name:>12}: {USERS} concurrent searchers -> {pairs} chats, nobody claimed twice")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# triggers.py
+# 🚫 THE KILL SWITCH (Skip Trigger Lists) + compiled matchers
+# Every list is compiled once into a single regex that only matches whole words
+# (or whole phrases), so "ai" no longer fires on "said" and "hat" no longer
+# fires on "what". find() returns the trigger that matched, or None.
+import random
+import re
+import time
+
+# ==============================================================================
+# 📜 TRIGGER LISTS
+# ==============================================================================
+SKIP_TRIGGERS = {
+    # 1. HATES_MEN: Used by Male personas to skip other males
+    "hates_men": [
+        "m", "male", "boy", "man", "guy", "dude", "bro", "bhai",
+        "m 21", "m 22", "m 23", "m 24", "m 18", "m 19", "uncle", "grandpa",
+        "m here", "im m", "i am m", "bye", "byy", "bot"
+    ],
+    # 2. ZERO: Strict girls (Nisha, etc.) - Skips ANY flirt/vulgarity
+    "zero": [
+        "sex", "horny", "nude", "bobs", "vegana", "pics", "cam", "video",
+        "sexy", "hot", "dick", "cock", "fuck",
+        "suck", "meet", "number", "whatsapp", "date",
+        "snap", "porn", "chut", "lund", "chudai", "bye", "bot"
+    ],
+    # 3. MEDIUM: Normal girls - Skips direct vulgarity/demands
+    "medium": [
+        "nude", "naked", "bobs", "vegana", "dick", "cock",
+        "pussy", "fuck", "suck", "pay", "money", "rate", "cam", "video call", "vc", "bye", "bot"
+    ],
+    # 4. HIGH: Spicy girls (Ayu, etc.) - Only skips RED LINES
+    "high": [
+        "nude", "naked", "topless", "open cloth", "strip", "price",
+        "pay", "rate", "cam", "video", "vc",
+        "rape", "force", "cp", "porn", "bye", "bot"
+    ]
+}
+
+# Any persona: the user is onto us
+SUSPICIOUS_TRIGGERS = ["bot", "chatbot", "ai", "chatgpt", "fake", "automated", "robot", "groq"]
+
+# The Doorman: if the AI's own reply says one of these, it leaves the chat
+DOORMAN_TRIGGERS = ["bye", "skip", "stop", "boring", "bsdk", "hat", "leave", "gtg"]
+
+
+def _trie_pattern(words):
+    """
+    ['man', 'male', 'm 21'] -> 'm(?:(?:\\s+21|a(?:le|n)))?'. Python's re has no
+    Aho-Corasick, but with shared prefixes factored out it only walks each
+    prefix once instead of retrying every alternative at every position.
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w: node = node.setdefault(ch, {})
+        node[""] = {} # End of a trigger
+    def build(node):
+        alts = [(r"\s+" if ch == " " else re.escape(ch)) + build(child)
+                for ch, child in sorted(node.items()) if ch]
+        if not alts: return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body # Greedy -> longest trigger wins
+    return build(trie)
+
+
+class TriggerMatcher:
+    """
+    One compiled regex for a whole trigger list. A trigger matches as a whole word
+    (plural 's' allowed: "bots", "guys"); spaces inside a phrase match any run of
+    whitespace. The longest trigger wins, so "video call" beats "video".
+    An apostrophe (straight or curly, as iOS sends it) counts as part of the word,
+    so the 'm' in "i'm" / "i’m" is not "m". One-letter triggers get no plural:
+    "ms" is not "m".
+    """
+    def __init__(self, triggers):
+        self.triggers = frozenset(" ".join(t.lower().split()) for t in triggers if t.strip())
+        words = _trie_pattern(t for t in self.triggers if len(t) > 1)
+        letters = "".join(re.escape(t) for t in sorted(self.triggers) if len(t) == 1)
+        alts = ([f"(?:{words})s?"] if words else []) + ([f"[{letters}]"] if letters else [])
+        self.regex = re.compile(rf"(?<![\w'‘’])(?:{'|'.join(alts)})(?![\w'‘’])", re.IGNORECASE) if alts else None
+
+    def find(self, text):
+        """The trigger found in text, or None."""
+        if not text or not self.regex: return None
+        m = self.regex.search(text)
+        if not m: return None
+        hit = " ".join(m.group(0).lower().split())
+        return hit if hit in self.triggers else hit[:-1] # Drop the plural 's'
+
+    def __contains__(self, text):
+        return self.find(text) is not None
+
+
+# One regex per tolerance covers the suspicion check too -> one search per user message
+SKIP_MATCHERS = {level: TriggerMatcher(SUSPICIOUS_TRIGGERS + words) for level, words in SKIP_TRIGGERS.items()}
+SUSPICIOUS = TriggerMatcher(SUSPICIOUS_TRIGGERS)
+DOORMAN = TriggerMatcher(DOORMAN_TRIGGERS)
+
+
+# ==============================================================================
+# 📊 REGRESSION CORPUS + BENCHMARK: python triggers.py
+# ==============================================================================
+# (text, matcher, expected trigger or None). The None rows are the false skips
+# the old substring checks produced.
+_CORPUS = [
+    ("what did you said", "suspicious", None),          # 'ai' in 'said'
+    ("i love rain and trains", "suspicious", None),     # 'ai' in 'rain'
+    ("about my day", "suspicious", None),               # 'bot' in 'about'
+    ("are you a bot?", "suspicious", "bot"),
+    ("BOTS everywhere", "suspicious", "bot"),
+    ("is this ai", "suspicious", "ai"),
+    ("r u a chatbot", "suspicious", "chatbot"),
+    ("are you a chatbot?", "suspicious", "chatbot"),
+    ("you sound fake lol", "suspicious", "fake"),
+    ("what are you doing", "doorman", None),            # 'hat' in 'what'
+    ("that is crazy", "doorman", None),                 # 'hat' in 'that'
+    ("keep it up", "doorman", None),
+    ("ok bye!", "doorman", "bye"),                      # old check missed it (punctuation)
+    ("gtg, mom calls", "doorman", "gtg"),
+    ("so boring", "doorman", "boring"),
+    ("i wanna stop now", "doorman", "stop"),
+    ("im from mumbai", "hates_men", None),              # 'm' / 'bhai' inside words
+    ("my name is emma", "hates_men", None),             # 'm' / 'man' inside words
+    ("germany is nice", "hates_men", None),             # 'man' in 'germany'
+    ("i like mangoes", "hates_men", None),              # 'man' in 'mangoes'
+    ("brother is here", "hates_men", None),             # 'bro' in 'brother'
+    ("m 21 here", "hates_men", "m 21"),
+    ("hey bro", "hates_men", "bro"),
+    ("hey guys", "hates_men", "guy"),
+    ("im m", "hates_men", "im m"),
+    ("m", "hates_men", "m"),                            # old check needed spaces around it
+    ("i'm fine", "hates_men", None),                    # 'm' after an apostrophe
+    ("I'm from delhi", "hates_men", None),
+    ("i'm 20", "hates_men", None),
+    ("I’m fine", "hates_men", None),                    # iOS curly apostrophe
+    ("i’m from delhi", "hates_men", None),
+    ("ms word is open", "hates_men", None),             # no plural for one-letter 'm'
+    ("mans world", "hates_men", "man"),
+    ("i am a dude.", "hates_men", "dude"),
+    ("what a photo", "zero", None),                     # 'hot' in 'photo'
+    ("camera is broken", "zero", None),                 # 'cam' in 'camera'
+    ("update me", "zero", None),                        # 'date' in 'update'
+    ("send pics", "zero", "pics"),
+    ("you are hot", "zero", "hot"),
+    ("can we meet", "zero", "meet"),
+    ("accurate answer", "medium", None),                # 'rate' in 'accurate'
+    ("i will repay you", "medium", None),               # 'pay' in 'repay'
+    ("video   call?", "medium", "video call"),
+    ("whats your rate", "medium", "rate"),
+    ("the price is right", "high", "price"),
+    ("reinforce it", "high", None),                     # 'force' in 'reinforce'
+    ("grapes are tasty", "high", None),                 # 'rape' in 'grapes'
+    ("strip club", "high", "strip"),
+    ("you talk like chatgpt", "medium", "chatgpt"),      # suspicion lives in every tolerance
+    ("she said hi", "high", None),
+]
+
+def _old_find(text, kind):
+    """The substring checks the matchers replace, for comparison."""
+    low = text.lower()
+    if kind == "suspicious": return next((t for t in SUSPICIOUS_TRIGGERS if t in low), None)
+    if kind == "doorman": return next((t for t in DOORMAN_TRIGGERS if f" {t} " in f" {low} "), None)
+    # process_message: is_suspicious() first, then the tolerance list
+    return _old_find(text, "suspicious") or next((t for t in SKIP_TRIGGERS[kind] if t in f" {low} "), None)
+
+def _matcher(kind):
+    return {"suspicious": SUSPICIOUS, "doorman": DOORMAN}.get(kind) or SKIP_MATCHERS[kind]
+
+def _regression():
+    old_false = new_false = 0
+    for text, kind, want in _CORPUS:
+        got = _matcher(kind).find(text)
+        assert got == want, f"{text!r} [{kind}]: expected {want!r}, got {got!r}"
+        if want is None and _old_find(text, kind) is not None: old_false += 1
+        if want is None and got is not None: new_false += 1
+    clean = sum(1 for _, _, w in _CORPUS if w is None)
+    print(f"corpus: {len(_CORPUS)} cases | false skips on {clean} clean messages: old {old_false}, new {new_false}")
+
+def _benchmark(n=20000):
+    rnd = random.Random(7)
+    # Ordinary chat: most messages hit nothing, so both sides scan the whole message
+    vocab = ("hey hi hello how are you doing today from delhi lol ok nice music movies "
+             "where do live kinda tired work study sleep food pizza song fun").split()
+    msgs = [" ".join(rnd.choices(vocab, k=rnd.randint(2, 12))) for _ in range(n)]
+    for kind in ("suspicious", "doorman", "hates_men", "zero", "medium", "high"):
+        matcher = _matcher(kind)
+        t0 = time.perf_counter()
+        for m in msgs: _old_find(m, kind)
+        old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for m in msgs: matcher.find(m)
+        new = time.perf_counter() - t0
+        print(f"{kind:>10} | old: {n / old / 1000:7.0f}k msg/s | compiled: {n / new / 1000:7.0f}k msg/s")
+
+if __name__ == "__main__":
+    _regression()
+    _benchmark()
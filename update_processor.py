@@ -0,0 +1,60 @@
+# update_processor.py
+# 🚦 CONCURRENT UPDATES, ORDERED PER USER
+# PTB processes updates one by one by default, so one slow Groq call or a
+# secret-media timer holds up everybody. Here different users run in parallel
+# while each user's own updates still run strictly in arrival order.
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=64):
+        # PTB's own semaphore wraps do_process_update, so an update waiting for its
+        # user's turn would hold a slot. Make that one effectively unlimited and
+        # apply the real cap only once it's the update's turn to run.
+        super().__init__(max_concurrent_updates=2 ** 20)
+        self.cap = max_concurrent_updates
+        self.slots = None   # asyncio.Semaphore, created in initialize()
+        self.locks = {}     # {user_id: asyncio.Lock} (FIFO -> arrival order)
+        self.pending = {}   # {user_id: updates queued or running}
+
+    @staticmethod
+    def key_for(update):
+        user = getattr(update, "effective_user", None)
+        if user: return user.id
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.key_for(update)
+        if key is None:
+            async with self.slots: await coroutine
+            return
+
+        self.pending[key] = self.pending.get(key, 0) + 1
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                async with self.slots:
+                    await coroutine
+        finally:
+            self.pending[key] -= 1
+            if not self.pending[key]:
+                del self.pending[key]
+                del self.locks[key]
+
+    async def initialize(self):
+        self.slots = asyncio.Semaphore(self.cap)
+
+    async def shutdown(self):
+        pass
+
+    def queue_length(self, user_id):
+        return self.pending.get(user_id, 0)
+
+    def stats(self):
+        busiest = max(self.pending.items(), key=lambda kv: kv[1], default=(None, 0))
+        return {"users": len(self.pending), "queued": sum(self.pending.values()),
+                "running": self.cap - self.slots._value if self.slots else 0,
+                "busiest": busiest[0], "busiest_len": busiest[1]}